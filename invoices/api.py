@@ -0,0 +1,266 @@
+import itertools
+import time as ttime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+import requests.exceptions
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError
+
+from cache import revalidation_headers
+from entries import TIMELOG_FIELDS, TIMELOG_TASK_FIELDS, TIMELOG_USER_FIELDS, decode_time_entries, decode_timelogs
+from ratelimit import RateLimiter, parse_retry_after
+
+# http statuses on which request is repeated (rate limit and temporary gateway/server problems)
+
+RETRY_STATUSES = (429, 502, 503, 504)
+
+# methods which are safe to repeat after any of RETRY_STATUSES or connection error.
+# POST (invoice creation) and PUT (adding line items) aren't: after 5xx, read timeout or broken connection
+# the server may have done it already. They are repeated only on 429 (rejected without processing)
+# and when connection couldn't be opened (request wasn't sent), see attach_lineitems in pipeline.py for PUT
+
+IDEMPOTENT_METHODS = ('GET',)
+
+# statuses of v3 timelogs endpoint which mean that instance has no v3 API, time entries are taken from v1
+
+NO_V3_STATUSES = (400, 404)
+
+
+# shared client for Teamwork API - one keep-alive connection pool for all calls of the script,
+# timeouts, rate limiting, retries with exponential backoff, optional local cache of GET responses
+# and optional metrics (latency, status and bytes of every request)
+
+class TeamworkClient:
+
+    def __init__(self, domain, apikey, timeout=60, retries=5, backoff=1.0, pool_size=10, limiter=None, cache=None, metrics=None):
+        self.domain = domain.rstrip('/')
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.limiter = limiter or RateLimiter()
+        self.cache = cache
+        self.metrics = metrics
+        self.time_entries_v3 = None  # unknown till first request, then True or False (v1 is used)
+
+        self.session = requests.Session()
+        self.session.auth = (apikey, '')
+        self.session.headers.update({'Content-type': 'application/json'})
+
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    # cache_ttl - seconds while cached response is used without request (0 - always revalidate),
+    # None - response isn't cached at all
+
+    def get(self, path, params=None, cache_ttl=None):
+        if self.cache is None or cache_ttl is None:
+            return self.request('GET', path, params=params)
+
+        cached, age = self.cache.lookup(self.domain, path, params)
+
+        if cached is not None and age < cache_ttl:
+            self.cache.count('hits')
+            return cached
+
+        headers = revalidation_headers(cached) if cached is not None else None
+
+        response = self.request('GET', path, params=params, headers=headers)
+
+        if response.status_code == 304 and cached is not None:
+            self.cache.touch(self.domain, path, params)
+            self.cache.count('revalidated')
+            return cached
+
+        self.cache.store(self.domain, path, params, response)
+        self.cache.count('misses')
+        return response
+
+    def post(self, path, json=None):
+        return self.request('POST', path, json=json)
+
+    def put(self, path, json=None):
+        return self.request('PUT', path, json=json)
+
+    # makes request with retries, raises requests.exceptions.HTTPError (like raise_for_status) if all attempts failed
+
+    def request(self, method, path, params=None, json=None, headers=None):
+        url = self.domain + path
+        attempt = 0
+
+        while True:
+            self.limiter.acquire()
+
+            response = None
+            started = ttime.perf_counter()
+            try:
+                response = self.session.request(method, url, params=params, json=json, headers=headers,
+                                                timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if self.metrics:
+                    self.metrics.observe_request(method, path, 'error', ttime.perf_counter() - started)
+                if (method not in IDEMPOTENT_METHODS and not request_not_sent(e)) or attempt >= self.retries:
+                    raise
+            else:
+                if self.metrics:
+                    self.metrics.observe_request(method, path, response.status_code, ttime.perf_counter() - started,
+                                                 wire_bytes(response), len(response.request.body or b''),
+                                                 len(response.content))
+                self.limiter.update(response)
+                if not self.should_retry(method, response.status_code) or attempt >= self.retries:
+                    response.raise_for_status()
+                    return response
+
+            # Retry-After is already applied by limiter, otherwise back off
+
+            if response is None or parse_retry_after(response.headers.get('Retry-After')) is None:
+                self.limiter.pause(self.backoff * (2 ** attempt))
+            attempt += 1
+
+    # getting all pages of paginated endpoint: first page gives X-Pages, then other pages are fetched
+    # concurrently by max_workers threads, yields (page number, page json) strictly in pages order.
+    # At most max_workers pages are requested or wait to be read at once (next page is requested when one is read),
+    # so memory doesn't grow with number of pages.
+    # decode - function of response body to page json instead of response.json() (for records instead of dicts),
+    # count_pages - function of first response and its page json to number of pages instead of X-Pages
+
+    def iter_pages(self, path, params, max_workers=1, cache_ttl=None, decode=None, count_pages=None):
+
+        def page_json(response):
+            return decode(response.content) if decode else response.json()
+
+        response = self.get(path, params=params, cache_ttl=cache_ttl)
+
+        first_page = page_json(response)
+
+        if count_pages:
+            pages = count_pages(response, first_page)
+        else:
+            pages = int(response.headers.get('X-Pages', 1))
+
+        yield 1, first_page
+
+        if pages <= 1:
+            return
+
+        def fetch(page):
+            return page_json(self.get(path, params=dict(params, page=page), cache_ttl=cache_ttl))
+
+        if self.metrics:
+            fetch = self.metrics.bound(fetch)
+
+        if max_workers <= 1:
+            for page in range(2, pages + 1):
+                yield page, fetch(page)
+            return
+
+        next_pages = iter(range(2, pages + 1))
+        in_flight = deque()
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, pages - 1)) as executor:
+            try:
+                for page in itertools.islice(next_pages, max_workers):
+                    in_flight.append((page, executor.submit(fetch, page)))
+
+                while in_flight:
+                    page, future = in_flight.popleft()
+                    fetched = future.result()
+
+                    for next_page in itertools.islice(next_pages, 1):
+                        in_flight.append((next_page, executor.submit(fetch, next_page)))
+
+                    yield page, fetched
+            finally:
+                # reading stopped early (error or consumer closed generator) - pages not yet started aren't requested
+                for _, future in in_flight:
+                    future.cancel()
+
+    # time entries of project page by page as v1 pages ({'STATUS': 'OK', 'time-entries': [TimeEntry]}):
+    # billable and not invoiced of dates (YYYYMMDD) or, with updated_after (YYYYMMDDHHMMSS), all changed since then.
+    # v3 timelogs are asked only for fields the script uses (sparse fieldsets, names of people and tasks once
+    # per page as included objects), v1 time_entries where v3 isn't available (instance answers 400/404)
+
+    def iter_time_entries(self, project, start_date=None, end_date=None, updated_after=None, page_size=500, max_workers=1):
+
+        if self.time_entries_v3 is not False:
+            if updated_after:
+                params = {'updatedAfter': '{}-{}-{}T{}:{}:{}Z'.format(updated_after[:4], updated_after[4:6], updated_after[6:8],
+                                                                     updated_after[8:10], updated_after[10:12], updated_after[12:14])}
+            else:
+                params = {'billableType': 'billable',
+                          'invoicedType': 'noninvoiced',
+                          'startDate': '{}-{}-{}'.format(start_date[:4], start_date[4:6], start_date[6:]),
+                          'endDate': '{}-{}-{}'.format(end_date[:4], end_date[4:6], end_date[6:])}
+            params.update({'include': 'users,tasks',
+                           'fields[timelogs]': TIMELOG_FIELDS,
+                           'fields[users]': TIMELOG_USER_FIELDS,
+                           'fields[tasks]': TIMELOG_TASK_FIELDS,
+                           'pageSize': page_size})
+
+            pages = self.iter_pages('/projects/api/v3/projects/' + project + '/time.json', params=params,
+                                    max_workers=max_workers, decode=decode_timelogs, count_pages=timelog_pages)
+            try:
+                first_page = next(pages)
+            except requests.exceptions.HTTPError as e:
+                if self.time_entries_v3 or e.response is None or e.response.status_code not in NO_V3_STATUSES:
+                    raise
+                self.time_entries_v3 = False
+            else:
+                self.time_entries_v3 = True
+                yield first_page
+                yield from pages
+                return
+
+        if updated_after:
+            params = {'updatedAfterDate': updated_after,
+                      'pageSize': page_size}
+        else:
+            params = {'billableType': 'billable',
+                      'invoicedType': 'noninvoiced',
+                      'fromdate': start_date,
+                      'todate': end_date,
+                      'pageSize': page_size}
+
+        yield from self.iter_pages('/projects/' + project + '/time_entries.json', params=params,
+                                   max_workers=max_workers, decode=decode_time_entries)
+
+    def should_retry(self, method, status_code):
+        if status_code == 429:
+            return True
+        return status_code in RETRY_STATUSES and method in IDEMPOTENT_METHODS
+
+    def close(self):
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+
+
+# pages of v3 timelogs: meta.page.count is number of all records (pageSize - size of page asked for)
+
+def timelog_pages(response, page):
+    page_meta = page.get('meta', {}).get('page', {})
+    if page_meta.get('count') is None:
+        if page_meta.get('hasMore'):
+            raise ValueError('v3 timelogs page without meta.page.count: {}'.format(response.url))
+        return 1
+    page_size = int(page_meta.get('pageSize') or dict(parse_qsl(urlsplit(response.url).query)).get('pageSize') or 50)
+    return max(1, (int(page_meta['count']) + page_size - 1) // page_size)
+
+
+# connection to server wasn't opened (refused, unknown host, connect timeout), so request didn't reach it
+
+def request_not_sent(error):
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, ConnectTimeoutError)
+
+
+# bytes of response body as received (compressed), size of decoded content if it is unknown
+
+def wire_bytes(response):
+    try:
+        return response.raw.tell() or len(response.content)
+    except AttributeError:
+        return len(response.content)
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3.8
+
+import datetime
+import getopt
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time as ttime
+import tracemalloc
+
+import mock_server
+import pipeline
+from costs import Rate, aggregate_time_entries, cents_to_money, group_time_entries
+from entries import decode_time_entries
+from pdf import PdfRenderer, generate_html, generate_pdf, invoice_template, render_pdf, template_values, wkhtmltopdf_configuration
+
+# benchmarks of month-end run on synthetic data, every stage separately: aggregation of time entries,
+# per person grouping, html and pdf of invoice, end-to-end run of main.py against mock_server.py.
+# Results go to json, so runs of different versions can be compared
+
+BENCHMARKS = ('decode', 'aggregate', 'group', 'generate_html', 'generate_html_stream', 'generate_pdf', 'end_to_end')
+
+# prints error and usage instructions in situations when wrong arguments passed in console
+
+def print_usage():
+    script_name = os.path.basename(__file__)
+    print('Error: wrong startup arguments')
+    print('Usage:', script_name, ' --out <json_file> --only <benchmarks_coma_separated> --projects <projects> --entries <entries> --people <people> --person_entries <entries> --repeat <repeat> --e2e_projects <projects> --e2e_latency <ms> --seed <seed>')
+    print('Help:', script_name, ' --help')
+
+# prints help for running with --help flag
+
+def print_help():
+    script_name = os.path.basename(__file__)
+
+    help = f'''
+        {script_name} --out <json_file> --only <benchmarks_coma_separated> --projects <projects> --entries <entries> --people <people> --person_entries <entries> --repeat <repeat> --e2e_projects <projects> --e2e_latency <ms> --seed <seed>
+
+        Benchmarks of invoices script on synthetic data. All arguments are optional.
+
+        Benchmarks: {', '.join(BENCHMARKS)}
+            decode - decoding of api pages of time entries into records, memory of decoded entries (and of entries as dicts of json)
+            aggregate - filtering and aggregation of time entries of all projects (summary time and cost, ids per person)
+            group - only grouping of entries per person for pdfs (no filtering, rates and costs), in the project with --person_entries entries of one person
+            generate_html, generate_html_stream - html of invoice of person with --person_entries rows (whole string / chunks as pdfs get it)
+            generate_pdf - pdf of the same invoice, of invoice with 13 rows and of empty page (what one wkhtmltopdf process costs without content, paid for every pdf), skipped if wkhtmltopdf or, on Linux, Xvfb/xvfb-run isn't installed
+            end_to_end - main.py against mock_server.py (--e2e_projects projects, --e2e_latency), without pdfs
+
+        Examples:
+
+            {script_name} --out benchmark.json
+            {script_name} --entries 1000000 --person_entries 50000 --only aggregate,group --out big.json
+
+        Arguments:
+
+            --out json_file
+                File for results, default benchmark.json.
+
+            --only benchmarks
+                Run only these benchmarks, coma separated.
+
+            --projects projects
+                Projects in synthetic data, default 1000.
+
+            --entries entries
+                Time entries in synthetic data (all projects), default 100000. 1000000 entries need about 2 GB of memory.
+
+            --people people
+                People in synthetic data, default 200.
+
+            --person_entries entries
+                Time entries of one person in one project (added to --entries), default 5000.
+
+            --repeat repeat
+                How many times every benchmark is run (result is minimum and median), default 3.
+
+            --e2e_projects projects
+                Projects of mock server for end_to_end, default 50.
+
+            --e2e_latency ms
+                Latency of mock server for end_to_end, default 0.
+
+            --seed seed
+                Seed of synthetic data, default 1.
+
+            --help
+                print this message
+    '''
+    print(help)
+
+
+# time entries of projects in format of Teamwork API (fields used by script) and rates of project people,
+# first person has person_entries entries in first project
+
+def synthetic_entries(projects, entries, people, person_entries, seed=1):
+    rnd = random.Random(seed)
+
+    persons = [(str(100 + i), 'First{}'.format(i), 'Last{}'.format(i)) for i in range(people)]
+
+    entries_by_project = {}
+    rates_by_project = {}
+
+    entry_id = 1000000
+    for project_number in range(projects):
+        project = str(10000 + project_number)
+        members = rnd.sample(persons, min(len(persons), 8))
+        if project_number == 0:
+            members[0] = persons[0]
+
+        rates_by_project[project] = {person[0]: '{}.{:02d}'.format(rnd.randint(5, 60), rnd.choice([0, 25, 50])) for person in members}
+
+        count = entries // projects + (1 if project_number < entries % projects else 0)
+        authors = [rnd.choice(members) for _ in range(count)]
+        if project_number == 0:
+            authors += [persons[0]] * person_entries
+
+        project_entries = []
+        for person_id, first_name, last_name in authors:
+            entry_id += 1
+            minutes = rnd.randint(5, 480)
+            project_entries.append({
+                'id': str(entry_id),
+                'person-id': person_id,
+                'person-first-name': first_name,
+                'person-last-name': last_name,
+                'project-id': project,
+                'minutes': str(minutes % 60),
+                'hours': str(minutes // 60),
+                'hoursDecimal': str(round(minutes / 60, 2)),
+                'date': '2020-05-{:02d}T09:00:00Z'.format(rnd.randint(1, 31)),
+                'description': 'Work {}'.format(entry_id),
+                'todo-item-name': 'Task {}'.format(entry_id % 50),
+                'invoiceNo': '',
+                'invoiceStatus': '',
+                'isbillable': '1' if rnd.random() < 0.9 else '0',
+            })
+        entries_by_project[project] = project_entries
+
+    return entries_by_project, rates_by_project
+
+
+# template values of invoice of person, as process_project makes them for pdf
+
+def invoice_values(entries, rates):
+    invoices = []
+    for entrie in entries:
+        invoices.append({
+            'date': datetime.datetime.strptime(entrie.date, r'%Y-%m-%dT%H:%M:%SZ'),
+            'name': entrie.name,
+            'task': entrie.todo_item_name,
+            'comment': entrie.description,
+            'time': round(entrie.total_minutes / 60, 2),
+            'cost': cents_to_money(Rate(rates[entrie.person_id]).cost_cents(entrie.total_minutes)),
+        })
+    return {'name': invoices[0]['name'], 'date': datetime.datetime.utcnow(), 'invoices': invoices}
+
+
+# runs function repeat times: minimum and median of wall time, function result of last run
+
+def measure(function, repeat):
+    runs = []
+    result = None
+    for _ in range(repeat):
+        started = ttime.perf_counter()
+        result = function()
+        runs.append(ttime.perf_counter() - started)
+    return {'seconds': min(runs), 'median_seconds': statistics.median(runs), 'runs': runs}, result
+
+
+# api pages (json of response, pipeline.PAGE_SIZE entries) of time entries of every project
+
+def response_pages(entries_by_project):
+    pages_by_project = {}
+    for project, entries in entries_by_project.items():
+        pages_by_project[project] = [
+            json.dumps({'STATUS': 'OK', 'time-entries': entries[start:start + pipeline.PAGE_SIZE]}).encode('utf8')
+            for start in range(0, len(entries), pipeline.PAGE_SIZE)]
+    return pages_by_project
+
+
+def decode_all(pages_by_project, decode=decode_time_entries):
+    return {project: [entrie for page in pages for entrie in decode(page)['time-entries']]
+            for project, pages in pages_by_project.items()}
+
+
+# memory (bytes) held by decoded entries of all projects
+
+def decoded_size(pages_by_project, decode=decode_time_entries):
+    tracemalloc.start()
+    try:
+        entries_by_project = decode_all(pages_by_project, decode)
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del entries_by_project
+    return size
+
+
+def aggregate_all(entries_by_project, rates_by_project, keep_entries):
+    persons = 0
+    for project, entries in entries_by_project.items():
+        aggregate = aggregate_time_entries(pipeline.uninvoiced_billable(entries), rates_by_project[project], keep_entries)
+        persons += len(aggregate['items'])
+    return persons
+
+
+# reason why pdf can't be rendered here (None if it can): no wkhtmltopdf, on Linux also no X server for it
+# (Xvfb of PdfRenderer or xvfb-run of wkhtmltopdf.sh)
+
+def pdf_unavailable():
+    try:
+        wkhtmltopdf_configuration()
+    except IOError:
+        return 'wkhtmltopdf not found'
+    if platform.system() == 'Linux' and shutil.which('Xvfb') is None and shutil.which('xvfb-run') is None:
+        return 'Xvfb and xvfb-run not found'
+    return None
+
+
+# main.py (subprocess, as it is run by cron) against mock server in this process
+
+def end_to_end(projects, latency, seed):
+    api = mock_server.MockTeamwork(mock_server.synthetic_data(projects=projects, seed=seed), latency=latency, seed=seed)
+    server = mock_server.serve(api, 0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py'),
+                       '--domain', 'http://127.0.0.1:{}'.format(server.server_address[1]), '--apikey', 'benchmark',
+                       '--project_ids', 'all_projects', '--start_date', '20200101', '--end_date', '20201231',
+                       '--logdir', directory, '--no-cache']
+            started = ttime.perf_counter()
+            subprocess.run(command, cwd=directory, check=True, stdout=subprocess.DEVNULL)
+            seconds = ttime.perf_counter() - started
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    return seconds, dict(api.stats)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "", ["help", "out=", "only=", "projects=", "entries=", "people=", "person_entries=", "repeat=", "e2e_projects=", "e2e_latency=", "seed="])
+    except getopt.GetoptError:
+        print_usage()
+        sys.exit(2)
+
+    OUT = 'benchmark.json'
+    ONLY = BENCHMARKS
+    PROJECTS = 1000
+    ENTRIES = 100000
+    PEOPLE = 200
+    PERSON_ENTRIES = 5000
+    REPEAT = 3
+    E2E_PROJECTS = 50
+    E2E_LATENCY = 0.0
+    SEED = 1
+
+    for opt, arg in opts:
+        if opt == '--help':
+            print_help()
+            sys.exit(2)
+        elif opt == '--out':
+            OUT = arg
+        elif opt == '--only':
+            ONLY = arg.split(',')
+        elif opt == '--projects':
+            PROJECTS = max(1, int(arg))
+        elif opt == '--entries':
+            ENTRIES = int(arg)
+        elif opt == '--people':
+            PEOPLE = max(8, int(arg))
+        elif opt == '--person_entries':
+            PERSON_ENTRIES = max(1, int(arg))
+        elif opt == '--repeat':
+            REPEAT = max(1, int(arg))
+        elif opt == '--e2e_projects':
+            E2E_PROJECTS = int(arg)
+        elif opt == '--e2e_latency':
+            E2E_LATENCY = float(arg) / 1000
+        elif opt == '--seed':
+            SEED = int(arg)
+        else:
+            print_usage()
+            sys.exit(2)
+
+    for name in ONLY:
+        if name not in BENCHMARKS:
+            print_usage()
+            sys.exit(2)
+
+    results = {}
+
+    def report(name, result, **extra):
+        result.update(extra)
+        results[name] = result
+        print('{:<22} {:>10.3f} s  {}'.format(name, result['seconds'], ', '.join('{} {}'.format(k, v) for k, v in extra.items())))
+
+    print('Synthetic data: {} projects, {} time entries + {} entries of one person'.format(PROJECTS, ENTRIES, PERSON_ENTRIES))
+
+    API_ENTRIES_BY_PROJECT, RATES_BY_PROJECT = synthetic_entries(PROJECTS, ENTRIES, PEOPLE, PERSON_ENTRIES, SEED)
+    PAGES_BY_PROJECT = response_pages(API_ENTRIES_BY_PROJECT)
+    del API_ENTRIES_BY_PROJECT
+    ENTRIES_BY_PROJECT = decode_all(PAGES_BY_PROJECT)
+    TOTAL_ENTRIES = sum(len(entries) for entries in ENTRIES_BY_PROJECT.values())
+
+    FIRST_PROJECT = next(iter(ENTRIES_BY_PROJECT))
+    PERSON_VALUES = invoice_values(
+        [entrie for entrie in ENTRIES_BY_PROJECT[FIRST_PROJECT] if entrie.person_id == '100'][:PERSON_ENTRIES],
+        RATES_BY_PROJECT[FIRST_PROJECT])
+    SMALL_VALUES = dict(PERSON_VALUES, invoices=PERSON_VALUES['invoices'][:13])
+
+    invoice_template()  # template is compiled once per process in script too
+
+    for name in BENCHMARKS:
+
+        if name not in ONLY:
+            continue
+
+        if name == 'decode':
+            result, _ = measure(lambda: decode_all(PAGES_BY_PROJECT), REPEAT)
+            size = decoded_size(PAGES_BY_PROJECT)
+            dict_size = decoded_size(PAGES_BY_PROJECT, json.loads)
+            report(name, result, entries=TOTAL_ENTRIES, entries_per_second=round(TOTAL_ENTRIES / result['seconds']),
+                   bytes_per_entry=round(size / TOTAL_ENTRIES), dict_bytes_per_entry=round(dict_size / TOTAL_ENTRIES))
+
+        elif name == 'aggregate':
+            result, persons = measure(lambda: aggregate_all(ENTRIES_BY_PROJECT, RATES_BY_PROJECT, False), REPEAT)
+            report(name, result, entries=TOTAL_ENTRIES, persons=persons,
+                   entries_per_second=round(TOTAL_ENTRIES / result['seconds']))
+
+        elif name == 'group':
+            project_entries = ENTRIES_BY_PROJECT[FIRST_PROJECT]
+            result, persons = measure(lambda: group_time_entries(project_entries, keep_entries=True), REPEAT)
+            report(name, result, entries=len(project_entries), persons=len(persons),
+                   largest_person_entries=max(len(person.ids) for person in persons.values()),
+                   entries_per_second=round(len(project_entries) / result['seconds']))
+
+        elif name == 'generate_html':
+            result, html = measure(lambda: generate_html(dict(PERSON_VALUES)), REPEAT)
+            report(name, result, rows=len(PERSON_VALUES['invoices']), html_bytes=len(html.encode('utf8')))
+
+        elif name == 'generate_html_stream':
+            result, chunks = measure(lambda: sum(1 for _ in invoice_template().generate(template_values(dict(PERSON_VALUES)))), REPEAT)
+            report(name, result, rows=len(PERSON_VALUES['invoices']), chunks=chunks)
+
+        elif name == 'generate_pdf':
+            reason = pdf_unavailable()
+            if reason:
+                results[name] = {'skipped': reason}
+                print('{:<22} skipped ({})'.format(name, reason))
+                continue
+
+            # failed rendering (broken wkhtmltopdf or X server) skips only this benchmark, results of others are kept
+
+            try:
+                with PdfRenderer() as renderer, tempfile.TemporaryDirectory() as directory:
+                    result, _ = measure(lambda: render_pdf(dict(PERSON_VALUES), directory, 'person.pdf', renderer=renderer), REPEAT)
+                    small_result, _ = measure(lambda: render_pdf(dict(SMALL_VALUES), directory, 'small.pdf', renderer=renderer), REPEAT)
+                    empty_result, _ = measure(lambda: generate_pdf('<html><body></body></html>', directory, 'empty.pdf', renderer=renderer), REPEAT)
+            except OSError as e:
+                results[name] = {'skipped': 'pdf rendering failed: {}'.format(e)}
+                print('{:<22} skipped (pdf rendering failed: {})'.format(name, e))
+                continue
+            report(name, result, rows=len(PERSON_VALUES['invoices']))
+            report(name + '_13_rows', small_result, rows=len(SMALL_VALUES['invoices']))
+            report(name + '_empty_page', empty_result, share_of_13_rows=round(empty_result['seconds'] / small_result['seconds'], 2))
+
+        elif name == 'end_to_end':
+            runs = []
+            stats = None
+            for _ in range(REPEAT):
+                seconds, stats = end_to_end(E2E_PROJECTS, E2E_LATENCY, SEED)
+                runs.append(seconds)
+            report(name, {'seconds': min(runs), 'median_seconds': statistics.median(runs), 'runs': runs},
+                   projects=E2E_PROJECTS, latency_ms=E2E_LATENCY * 1000, requests=stats['requests'], invoices=stats['invoices'],
+                   bytes_sent=stats['bytes_sent'])
+
+    with open(OUT, 'w', encoding='utf8') as out_file:
+        json.dump({
+            'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'params': {'projects': PROJECTS, 'entries': ENTRIES, 'people': PEOPLE, 'person_entries': PERSON_ENTRIES,
+                       'repeat': REPEAT, 'e2e_projects': E2E_PROJECTS, 'e2e_latency_ms': E2E_LATENCY * 1000, 'seed': SEED},
+            'results': results,
+        }, out_file, indent=2)
+
+    print('Results:', OUT)
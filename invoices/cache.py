@@ -0,0 +1,99 @@
+import json
+import sqlite3
+import threading
+import time as ttime
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# headers of cached response which are kept (pagination headers are needed by callers)
+
+KEPT_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'X-Page', 'X-Pages', 'X-Records')
+
+
+# local on-disk cache of GET responses of Teamwork API, keyed by domain, endpoint and params
+# fresh entries (younger than ttl) are returned without request, stale ones are revalidated
+# by conditional request (If-None-Match / If-Modified-Since) if API gave ETag or Last-Modified
+
+class ResponseCache:
+
+    def __init__(self, path, refresh=False):
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(path), check_same_thread=False)
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                domain TEXT NOT NULL,
+                endpoint TEXT NOT NULL,
+                params TEXT NOT NULL,
+                body BLOB NOT NULL,
+                headers TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (domain, endpoint, params)
+            )''')
+        self.db.commit()
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0}
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    @staticmethod
+    def key(domain, endpoint, params):
+        return domain, endpoint, json.dumps(params or {}, sort_keys=True, default=str)
+
+    # cached response (requests.Response) and its age in seconds or (None, None)
+
+    def lookup(self, domain, endpoint, params):
+        if self.refresh:
+            return None, None
+        with self.lock:
+            row = self.db.execute(
+                'SELECT body, headers, fetched_at FROM responses WHERE domain = ? AND endpoint = ? AND params = ?',
+                self.key(domain, endpoint, params)).fetchone()
+        if row is None:
+            return None, None
+        body, headers, fetched_at = row
+        return cached_response(body, json.loads(headers), domain + endpoint), ttime.time() - fetched_at
+
+    def store(self, domain, endpoint, params, response):
+        headers = {name: response.headers[name] for name in KEPT_HEADERS if name in response.headers}
+        with self.lock:
+            self.db.execute(
+                'INSERT OR REPLACE INTO responses (domain, endpoint, params, body, headers, fetched_at) VALUES (?, ?, ?, ?, ?, ?)',
+                self.key(domain, endpoint, params) + (response.content, json.dumps(headers), ttime.time()))
+            self.db.commit()
+
+    # response wasn't changed (304) - entry is fresh again
+
+    def touch(self, domain, endpoint, params):
+        with self.lock:
+            self.db.execute(
+                'UPDATE responses SET fetched_at = ? WHERE domain = ? AND endpoint = ? AND params = ?',
+                (ttime.time(),) + self.key(domain, endpoint, params))
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def cached_response(body, headers, url):
+    response = requests.Response()
+    response._content = body
+    response.status_code = 200
+    response.headers = CaseInsensitiveDict(headers)
+    response.url = url
+    response.encoding = 'utf-8'
+    return response
+
+
+# conditional request headers for revalidation of cached response
+
+def revalidation_headers(response):
+    headers = {}
+    if 'ETag' in response.headers:
+        headers['If-None-Match'] = response.headers['ETag']
+    if 'Last-Modified' in response.headers:
+        headers['If-Modified-Since'] = response.headers['Last-Modified']
+    return headers
@@ -0,0 +1,115 @@
+from array import array
+from decimal import ROUND_HALF_UP, Decimal
+
+# money of time entries and expenses in exact integer cents. Rate of person in project is parsed once
+# (Decimal, not float), cost of entry is its minutes * rate / 60 rounded half up to cent. Costs of all entries
+# of person are computed in one batched pass over column of minutes, and the same cents go to report.txt,
+# journal, invoices summary and pdf (rows and total in file name), so their totals can't drift
+
+
+class Rate:
+
+    def __init__(self, rate):
+        # rate in cents per hour as exact fraction, cost = minutes * numerator / denominator
+        numerator, denominator = Decimal(str(rate)).scaleb(2).as_integer_ratio()
+        self.numerator = 2 * numerator
+        self.denominator = 2 * 60 * denominator
+        self.costs = {}  # minutes -> cents, durations of entries repeat a lot
+
+    def cost_cents(self, minutes):
+        cost = self.costs.get(minutes)
+        if cost is None:
+            cost = self.costs[minutes] = (minutes * self.numerator + self.denominator // 2) // self.denominator
+        return cost
+
+
+# time entries of one person in project as columns: ids, minutes and (after batched pass) cost in cents
+
+class PersonEntries:
+
+    def __init__(self, person_id, name, rate=None):
+        self.person_id = person_id
+        self.name = name
+        self.rate = rate
+        self.ids = []
+        self.minutes = array('l')
+        self.entries = []  # time entries themselves, only for pdf
+        self.costs = None
+
+    def add(self, entrie_id, minutes, entrie=None):
+        self.ids.append(entrie_id)
+        self.minutes.append(minutes)
+        if entrie is not None:
+            self.entries.append(entrie)
+
+    def cost_cents(self):
+        if self.costs is None:
+            self.costs = array('q', map(self.rate.cost_cents, self.minutes))
+        return self.costs
+
+    # (time entry, minutes, cost in cents) for rows of pdf
+
+    def rows(self):
+        return zip(self.entries, self.minutes, self.cost_cents())
+
+
+# time entries of project split in one pass into columns per person: 'person id;;person name' -> PersonEntries
+# (in order of first entry), entries themselves are kept only with keep_entries
+
+def group_time_entries(entries, keep_entries=False):
+
+    persons = {}
+
+    for entrie in entries:
+        key = entrie.person_id + ';;' + entrie.first_name + ' ' + entrie.last_name
+        person = persons.get(key)
+
+        if person is None:
+            person = persons[key] = PersonEntries(entrie.person_id, key.split(';;')[1])
+
+        person.add(entrie.id, entrie.total_minutes, entrie if keep_entries else None)
+
+    return persons
+
+
+# aggregation of time entries of project: entries are grouped per person, then summary time and cost
+# are computed per column with the rate of person in project
+
+def aggregate_time_entries(entries, project_rates, keep_entries=False):
+
+    rates = {}  # person id -> Rate
+    persons = group_time_entries(entries, keep_entries)
+
+    for person in persons.values():
+        if person.person_id not in rates:
+            rates[person.person_id] = Rate(project_rates[person.person_id])
+        person.rate = rates[person.person_id]
+
+    time_by_person = {}  # person id -> minutes
+    cost_cents_by_person = {}  # person id -> cost in cents
+    totals_by_person = {}  # 'person id;;person name' -> [minutes, cost in cents]
+
+    for key, person in persons.items():
+        minutes = sum(person.minutes)
+        cost_cents = sum(person.cost_cents())
+        totals_by_person[key] = [minutes, cost_cents]
+        time_by_person[person.person_id] = time_by_person.get(person.person_id, 0) + minutes
+        cost_cents_by_person[person.person_id] = cost_cents_by_person.get(person.person_id, 0) + cost_cents
+
+    return {
+        'time_by_person': time_by_person,
+        'cost_cents_by_person': cost_cents_by_person,
+        'items': {key: person.ids for key, person in persons.items()},
+        'totals_by_person': totals_by_person,
+        'persons': persons,
+    }
+
+
+# money string of API (cost of expense) in cents, rounded half up
+
+def money_cents(value):
+    return int(Decimal(str(value)).scaleb(2).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def cents_to_money(cents):
+    return round(cents / 100, 2)
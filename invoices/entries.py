@@ -0,0 +1,163 @@
+import json
+import sys
+
+# time entries are kept as compact records instead of dicts of API response: only fields used for
+# filtering, invoices and pdfs, hours and minutes as ints, billable as bool, ids and names of persons,
+# projects, tasks and dates interned (they repeat in thousands of entries). Pages are decoded straight
+# into records (object hook of json decoder), so dicts of page entries don't live longer than one entry
+
+# API field -> attribute of TimeEntry
+
+TIME_ENTRY_FIELDS = {
+    'id': 'id',
+    'person-id': 'person_id',
+    'person-first-name': 'first_name',
+    'person-last-name': 'last_name',
+    'project-id': 'project_id',
+    'hours': 'hours',
+    'minutes': 'minutes',
+    'hoursDecimal': 'hours_decimal',
+    'date': 'date',
+    'description': 'description',
+    'todo-item-name': 'todo_item_name',
+    'invoiceNo': 'invoice_no',
+    'invoiceStatus': 'invoice_status',
+    'isbillable': 'billable',
+}
+
+
+class TimeEntry:
+
+    __slots__ = tuple(TIME_ENTRY_FIELDS.values())
+
+    def __init__(self, id, person_id, first_name, last_name, project_id, hours, minutes, hours_decimal, date,
+                 description, todo_item_name, invoice_no='', invoice_status='', billable=True):
+        self.id = id
+        self.person_id = person_id
+        self.first_name = first_name
+        self.last_name = last_name
+        self.project_id = project_id
+        self.hours = hours
+        self.minutes = minutes
+        self.hours_decimal = hours_decimal
+        self.date = date
+        self.description = description
+        self.todo_item_name = todo_item_name
+        self.invoice_no = invoice_no
+        self.invoice_status = invoice_status
+        self.billable = billable
+
+    # record of time entry of API response (or of store, which keeps the same fields)
+
+    @classmethod
+    def from_api(cls, fields):
+        intern = sys.intern
+        return cls(
+            str(fields['id']),
+            intern(str(fields['person-id'])),
+            intern(fields['person-first-name']),
+            intern(fields['person-last-name']),
+            intern(str(fields['project-id'])),
+            int(fields['hours']),
+            int(fields['minutes']),
+            fields['hoursDecimal'],
+            intern(fields['date']),
+            fields['description'],
+            intern(fields['todo-item-name']),
+            fields['invoiceNo'] or '',
+            fields['invoiceStatus'] or '',
+            str(fields['isbillable']) == '1')
+
+    # fields in format of API (for store)
+
+    def to_api(self):
+        fields = {field: getattr(self, attribute) for field, attribute in TIME_ENTRY_FIELDS.items()}
+        fields['isbillable'] = '1' if self.billable else '0'
+        return fields
+
+    @property
+    def name(self):
+        return self.first_name + ' ' + self.last_name
+
+    @property
+    def total_minutes(self):
+        return 60 * self.hours + self.minutes
+
+    # date of entry in YYYYMMDD format (as dates of run)
+
+    @property
+    def day(self):
+        return self.date[:10].replace('-', '')
+
+    def __repr__(self):
+        return 'TimeEntry({})'.format(', '.join('{}={!r}'.format(attribute, getattr(self, attribute)) for attribute in self.__slots__))
+
+
+# object hook: objects with fields of time entry become records, other objects (page, nested objects of entry) stay dicts
+
+def time_entry_hook(fields):
+    if 'person-id' in fields and 'hoursDecimal' in fields:
+        return TimeEntry.from_api(fields)
+    return fields
+
+
+# page of time entries (body of API response) with entries as records
+
+def decode_time_entries(content):
+    return json.loads(content, object_hook=time_entry_hook)
+
+
+# v3 timelogs (/projects/api/v3/projects/<id>/time.json): only fields below are asked for (sparse fieldsets),
+# person names and task names come once per page as included users and tasks
+
+TIMELOG_FIELDS = 'id,userId,taskId,projectId,minutes,timeLogged,description,billable,invoiceId'
+TIMELOG_USER_FIELDS = 'id,firstName,lastName'
+TIMELOG_TASK_FIELDS = 'id,name'
+
+
+# record of v3 timelog, the same as of v1 entry (store and journal keep v1 fields, see to_api)
+
+def timelog_entry(timelog, users, tasks):
+    intern = sys.intern
+    person_id = str(timelog['userId'])
+    user = users.get(person_id, {})
+    task = tasks.get(str(timelog.get('taskId')), {})
+    hours, minutes = divmod(int(timelog['minutes']), 60)
+    return TimeEntry(
+        str(timelog['id']),
+        intern(person_id),
+        intern(user.get('firstName', '')),
+        intern(user.get('lastName', '')),
+        intern(str(timelog['projectId'])),
+        hours,
+        minutes,
+        str(round(int(timelog['minutes']) / 60, 2)),
+        intern(timelog['timeLogged']),
+        timelog.get('description') or '',
+        intern(task.get('name') or ''),
+        str(timelog['invoiceId']) if timelog.get('invoiceId') else '',
+        '',
+        bool(timelog['billable']))
+
+
+# included objects of v3 response by id (API gives them as {id: object}, list is accepted too)
+
+def included_by_id(included, kind):
+    objects = included.get(kind) or {}
+    if isinstance(objects, list):
+        return {str(item['id']): item for item in objects}
+    return {str(key): item for key, item in objects.items()}
+
+
+# page of v3 timelogs as page of v1 time entries: {'STATUS': 'OK', 'time-entries': [TimeEntry], 'meta': ...}
+
+def decode_timelogs(content):
+    page = json.loads(content)
+    if not isinstance(page, dict) or 'timelogs' not in page:
+        return {'STATUS': 'Error', 'time-entries': []}
+    included = page.get('included') or {}
+    users = included_by_id(included, 'users')
+    tasks = included_by_id(included, 'tasks')
+    return {'STATUS': 'OK',
+            'time-entries': [timelog_entry(timelog, users, tasks) for timelog in page['timelogs']],
+            'meta': page.get('meta') or {}}
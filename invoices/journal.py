@@ -0,0 +1,120 @@
+import datetime
+import json
+import os
+import threading
+
+# keys of project result which are kept in journal (enough for report.txt and invoices summary)
+
+JOURNALED_RESULT_KEYS = ('project', 'period', 'billing', 'expenses_cost', 'rates', 'time_by_person', 'cost_cents_by_person', 'invoices')
+
+
+# append-only journal of completed steps of the run (journal.jsonl in --logdir), every record is fsynced,
+# so after crash --resume knows which invoices were created, which got line items, which pdfs were written
+# and which projects are done. Records of run go after its 'run' record
+
+class RunJournal:
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = None
+
+    # records of last run (after its 'run' record), empty list if there is no journal
+
+    def last_run(self):
+        records = []
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, encoding='utf8') as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # last line may be cut by crash
+                    continue
+                if record['step'] == 'run':
+                    records = []
+                records.append(record)
+        return records
+
+    def open(self):
+        self.file = open(self.path, 'a', encoding='utf8')
+        return self
+
+    def write(self, step, **fields):
+        line = json.dumps(dict(fields, step=step), ensure_ascii=False, default=str) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+
+# what is already done in run which is resumed (empty for new run)
+
+class ResumeState:
+
+    def __init__(self, records=()):
+        self.projects = {}  # project -> journaled results (of periods) of done project
+        self.created = {}  # (project, period, kind, person) -> id of invoice without line items
+        self.attached = {}  # (project, period, kind, person) -> 'lineitems_attached' record
+        self.pdfs = {}  # (directory, filename) -> 'pdf_queued' record of pdf which isn't written yet
+
+        for record in records:
+            step = record['step']
+            if step == 'project_done':
+                self.projects[record['project']] = record['results']
+            elif step == 'invoice_created':
+                self.created[invoice_key(record)] = record['invoice']
+            elif step == 'lineitems_attached':
+                self.created.pop(invoice_key(record), None)
+                self.attached[invoice_key(record)] = record
+            elif step == 'pdf_queued':
+                self.pdfs[pdf_key(record)] = record
+            elif step == 'pdf_written':
+                self.pdfs.pop(pdf_key(record), None)
+
+    # invoices of project for period which got line items in resumed run
+
+    def attached_invoices(self, project, period, kind):
+        return [record for key, record in self.attached.items() if key[:3] == (project, period, kind)]
+
+    # ids of expenses or time entries of project (of all periods) which are already in invoices
+
+    def invoiced_ids(self, project, kind):
+        return {item for key, record in self.attached.items() if key[0] == project and key[2] == kind for item in record['items']}
+
+
+def invoice_key(record):
+    return record['project'], record['period'], record['kind'], record['person']
+
+
+def pdf_key(record):
+    return record['directory'], record['filename']
+
+
+# with --check-lost lost items of project are journaled too, resumed run reports them without fetching project again
+
+def journaled_result(result):
+    record = {key: getattr(result, key) for key in JOURNALED_RESULT_KEYS}
+    if result.ledger:
+        record['lost'] = result.ledger.journaled_lost()
+    return record
+
+
+# pdf values with dates, as they were written to journal
+
+def pdf_values(values):
+    values = dict(values)
+    values['date'] = parse_datetime(values['date'])
+    values['invoices'] = [dict(invoice, date=parse_datetime(invoice['date'])) for invoice in values['invoices']]
+    return values
+
+
+def parse_datetime(value):
+    return datetime.datetime.fromisoformat(value) if value else None
@@ -0,0 +1,223 @@
+import json
+import os
+import re
+import threading
+import time as ttime
+from contextlib import contextmanager
+
+# upper bounds of latency histograms buckets, seconds
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+PROMETHEUS_PREFIX = 'teamwork_invoices'
+
+
+class Histogram:
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'seconds': round(self.sum, 6),
+            'avg_seconds': round(self.sum / self.count, 6) if self.count else 0.0,
+            'max_seconds': round(self.max, 6),
+            'buckets': {str(bound): count for bound, count in zip(BUCKETS, self.buckets)},
+        }
+
+    # cumulative buckets as prometheus wants them, with +Inf
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            total += count
+            yield str(bound), total
+        yield '+Inf', self.count
+
+
+class PhaseStats:
+
+    def __init__(self):
+        self.histogram = Histogram()
+        self.requests = 0
+        self.bytes = 0
+
+    def summary(self):
+        return dict(self.histogram.summary(), requests=self.requests, bytes=self.bytes)
+
+
+class EndpointStats:
+
+    def __init__(self):
+        self.histogram = Histogram()
+        self.statuses = {}
+        self.received_bytes = 0
+        self.sent_bytes = 0
+        self.content_bytes = 0
+
+    def summary(self):
+        return dict(self.histogram.summary(), statuses=dict(self.statuses),
+                    received_bytes=self.received_bytes, sent_bytes=self.sent_bytes, content_bytes=self.content_bytes)
+
+
+# instrumentation of run: phases (fetch people, expenses, time entries, invoices, pdfs, report...) and
+# every http request by endpoint - counters, latency histograms, bytes. Current phase is kept per thread,
+# http requests of thread add their bytes and count to it. Phases of concurrent projects overlap,
+# so seconds of phase are sum of its durations, not wall time
+
+class Metrics:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started = ttime.time()
+        self.phases = {}
+        self.endpoints = {}
+
+    def current_phase(self):
+        return getattr(self.local, 'phase', None)
+
+    @contextmanager
+    def phase(self, name):
+        previous = self.current_phase()
+        self.local.phase = name
+        started = ttime.perf_counter()
+        try:
+            yield
+        finally:
+            self.local.phase = previous
+            self.observe_phase(name, ttime.perf_counter() - started)
+
+    # function for thread pool which runs in phase of thread which made it
+
+    def bound(self, function):
+        phase = self.current_phase()
+
+        def run(*args, **kwargs):
+            previous = self.current_phase()
+            self.local.phase = phase
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.local.phase = previous
+
+        return run
+
+    def observe_phase(self, name, seconds, size=0):
+        with self.lock:
+            stats = self.phases.setdefault(name, PhaseStats())
+            stats.histogram.observe(seconds)
+            stats.bytes += size
+
+    # one http request (attempt) - to endpoint stats and to current phase of thread,
+    # received_bytes - body as received (compressed), content_bytes - decoded body
+
+    def observe_request(self, method, path, status, seconds, received_bytes=0, sent_bytes=0, content_bytes=0):
+        key = (method, endpoint(path))
+        phase = self.current_phase()
+        with self.lock:
+            stats = self.endpoints.setdefault(key, EndpointStats())
+            stats.histogram.observe(seconds)
+            stats.statuses[str(status)] = stats.statuses.get(str(status), 0) + 1
+            stats.received_bytes += received_bytes
+            stats.sent_bytes += sent_bytes
+            stats.content_bytes += content_bytes
+            if phase:
+                phase_stats = self.phases.setdefault(phase, PhaseStats())
+                phase_stats.requests += 1
+                phase_stats.bytes += received_bytes + sent_bytes
+
+    def summary(self):
+        with self.lock:
+            return {
+                'started_at': self.started,
+                'seconds': round(ttime.time() - self.started, 3),
+                'phases': {name: stats.summary() for name, stats in self.phases.items()},
+                'endpoints': {method + ' ' + path: stats.summary() for (method, path), stats in self.endpoints.items()},
+            }
+
+    def write_json(self, path):
+        write_atomic(path, json.dumps(self.summary(), indent=2, ensure_ascii=False))
+
+    # textfile for node exporter textfile collector
+
+    def write_prometheus(self, path):
+        lines = []
+
+        def metric(name, kind, help_text):
+            lines.append('# HELP {}_{} {}'.format(PROMETHEUS_PREFIX, name, help_text))
+            lines.append('# TYPE {}_{} {}'.format(PROMETHEUS_PREFIX, name, kind))
+
+        def sample(name, labels, value):
+            label_text = ','.join('{}="{}"'.format(key, escape(str(label))) for key, label in labels.items())
+            lines.append('{}_{}{{{}}} {}'.format(PROMETHEUS_PREFIX, name, label_text, value))
+
+        def histogram(name, labels, hist):
+            for bound, count in hist.cumulative():
+                sample(name + '_bucket', dict(labels, le=bound), count)
+            sample(name + '_sum', labels, round(hist.sum, 6))
+            sample(name + '_count', labels, hist.count)
+
+        with self.lock:
+            metric('run_start_time_seconds', 'gauge', 'Start time of last run, unix time')
+            lines.append('{}_run_start_time_seconds {}'.format(PROMETHEUS_PREFIX, round(self.started, 3)))
+            metric('run_duration_seconds', 'gauge', 'Duration of last run')
+            lines.append('{}_run_duration_seconds {}'.format(PROMETHEUS_PREFIX, round(ttime.time() - self.started, 3)))
+
+            metric('phase_duration_seconds', 'histogram', 'Durations of phases of last run')
+            for name, stats in sorted(self.phases.items()):
+                histogram('phase_duration_seconds', {'phase': name}, stats.histogram)
+            metric('phase_requests', 'gauge', 'HTTP requests made in phase during last run')
+            for name, stats in sorted(self.phases.items()):
+                sample('phase_requests', {'phase': name}, stats.requests)
+            metric('phase_bytes', 'gauge', 'Bytes transferred (HTTP) or produced (html, pdf) in phase during last run')
+            for name, stats in sorted(self.phases.items()):
+                sample('phase_bytes', {'phase': name}, stats.bytes)
+
+            metric('http_request_duration_seconds', 'histogram', 'Latency of Teamwork API requests of last run')
+            for (method, endpoint_path), stats in sorted(self.endpoints.items()):
+                histogram('http_request_duration_seconds', {'method': method, 'endpoint': endpoint_path}, stats.histogram)
+            metric('http_requests', 'gauge', 'Teamwork API requests of last run by status')
+            for (method, endpoint_path), stats in sorted(self.endpoints.items()):
+                for status, count in sorted(stats.statuses.items()):
+                    sample('http_requests', {'method': method, 'endpoint': endpoint_path, 'status': status}, count)
+            metric('http_bytes', 'gauge', 'Bytes of Teamwork API requests and responses of last run (received - compressed, decoded - after decompression)')
+            for (method, endpoint_path), stats in sorted(self.endpoints.items()):
+                sample('http_bytes', {'method': method, 'endpoint': endpoint_path, 'direction': 'received'}, stats.received_bytes)
+                sample('http_bytes', {'method': method, 'endpoint': endpoint_path, 'direction': 'sent'}, stats.sent_bytes)
+                sample('http_bytes', {'method': method, 'endpoint': endpoint_path, 'direction': 'decoded'}, stats.content_bytes)
+
+        write_atomic(path, '\n'.join(lines) + '\n')
+
+
+# endpoint of path without ids, so requests of all projects go to one series
+
+def endpoint(path):
+    return re.sub(r'/\d+(?=/|\.json|$)', '/{id}', path)
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# node exporter may read file at any moment - it is written to temporary file and renamed
+
+def write_atomic(path, text):
+    path = str(path)
+    temporary = path + '.tmp'
+    with open(temporary, 'w', encoding='utf8') as metrics_file:
+        metrics_file.write(text)
+    os.replace(temporary, path)
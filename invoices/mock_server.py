@@ -0,0 +1,595 @@
+#!/usr/bin/env python3.8
+
+import datetime
+import getopt
+import gzip
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time as ttime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# local stand-in of Teamwork API for offline runs of main.py and load testing:
+# endpoints used by main.py on synthetic (or fixture) data, with latency, rate limit and error injection.
+# Invoices created by main.py exist only in memory of the server
+
+DEFAULT_PAGE_SIZE = 50
+
+GZIP_MIN_BYTES = 1024  # smaller responses are sent uncompressed, as web servers usually do
+
+# prints error and usage instructions in situations when wrong arguments passed in console
+
+def print_usage():
+    script_name = os.path.basename(__file__)
+    print('Error: wrong startup arguments')
+    print('Usage:', script_name, ' --port <port> --fixture <fixture_json> --dump <fixture_json> --projects <projects> --people <people> --entries <max_entries_per_project> --seed <seed> --latency <ms> --jitter <ms> --rate_limit <requests_per_minute> --error_rate <share> --lost_response_rate <share> --no_billing <project_ids_coma_separated> --no_gzip --no_v3')
+    print('Help:', script_name, ' --help')
+
+# prints help for running with --help flag
+
+def print_help():
+    script_name = os.path.basename(__file__)
+
+    help = f'''
+        {script_name} --port <port> --fixture <fixture_json> --dump <fixture_json> --projects <projects> --people <people> --entries <max_entries_per_project> --seed <seed> --latency <ms> --jitter <ms> --rate_limit <requests_per_minute> --error_rate <share> --lost_response_rate <share> --no_billing <project_ids_coma_separated> --no_gzip --no_v3
+
+        Local stand-in of Teamwork API for offline runs of main.py. Serves projects, people, rates, expenses and paginated time entries (v1 with X-Page/X-Pages/X-Records headers and v3 timelogs with fields[...]/include), creates invoices and line items in memory (GET /invoices/<id>.json returns line items of invoice).
+
+        All arguments are optional. Run main.py with --domain http://127.0.0.1:<port> and any --apikey.
+
+        Examples:
+
+            {script_name} --port 8900 --projects 200 --latency 150 --rate_limit 150
+            {script_name} --port 8900 --fixture fixture.json --error_rate 0.05
+
+        Arguments:
+
+            --port port
+                Port to listen on 127.0.0.1, default 8900.
+
+            --fixture fixture_json
+                Data from json file (people, projects, rates, expenses, time_entries - in the same format as --dump writes) instead of synthetic data.
+
+            --dump fixture_json
+                Write data (synthetic or from --fixture) to json file at start, e.g. to edit it and use as --fixture.
+
+            --projects projects
+                Number of synthetic projects, default 20.
+
+            --people people
+                Number of synthetic people, default 30 (the last one has the same full name as the first one).
+
+            --entries entries
+                Maximum number of time entries of synthetic project, default 1000.
+
+            --seed seed
+                Seed of synthetic data, default 1.
+
+            --latency ms
+                Delay of every response in milliseconds, default 0.
+
+            --jitter ms
+                Random addition to --latency up to ms milliseconds, default 0.
+
+            --rate_limit requests_per_minute
+                Requests per minute allowed (X-RateLimit-* headers, 429 with Retry-After after limit), default no limit.
+
+            --error_rate share
+                Share of requests which get random 502/503/504 response (temporary gateway errors), default 0. For example:
+                --error_rate 0.05
+
+            --lost_response_rate share
+                Share of invoice and line items requests (POST, PUT) which are done but answered with 502 or 504, as if the response was lost on the way back. For example:
+                --lost_response_rate 0.1
+
+            --no_billing project_ids
+                Projects where invoice creation fails with 400 (projects without billing option). Must be coma separated without blank spaces.
+
+            --no_gzip
+                Don't compress responses (by default responses from 1 KB are sent with Content-Encoding: gzip if client accepts it).
+
+            --no_v3
+                Answer 404 to v3 API (/projects/api/v3/...), as instance without it: main.py takes time entries from v1.
+
+            --help
+                print this message
+    '''
+    print(help)
+
+
+# synthetic data close to what Teamwork returns for fields used by main.py
+
+def synthetic_data(projects=20, people=30, entries=1000, seed=1, start=datetime.date(2020, 1, 1), days=365):
+    rnd = random.Random(seed)
+
+    persons = [{'id': str(100 + i), 'first-name': 'First{}'.format(i), 'last-name': 'Last{}'.format(i)} for i in range(people)]
+    if people > 1:
+        persons[-1].update({'first-name': persons[0]['first-name'], 'last-name': persons[0]['last-name']})
+
+    data = {'people': persons, 'projects': [], 'project_people': {}, 'rates': {}, 'expenses': {}, 'time_entries': {}}
+
+    record_id = 1000
+    for project_number in range(projects):
+        project = str(10000 + project_number)
+        members = rnd.sample(persons, min(len(persons), rnd.randint(3, 8)))
+
+        data['projects'].append({'id': project, 'name': 'Project {}'.format(project), 'status': 'active'})
+        data['project_people'][project] = [person['id'] for person in members]
+        data['rates'][project] = {person['id']: '{}.{:02d}'.format(rnd.randint(5, 60), rnd.choice([0, 25, 50])) for person in members}
+
+        time_entries = []
+        for _ in range(rnd.randint(entries // 10, entries)):
+            record_id += 1
+            person = rnd.choice(members)
+            date = start + datetime.timedelta(days=rnd.randrange(days))
+            minutes = rnd.randint(5, 480)
+            time_entries.append({
+                'id': str(record_id),
+                'project-id': project,
+                'person-id': person['id'],
+                'person-first-name': person['first-name'],
+                'person-last-name': person['last-name'],
+                'date': date.strftime('%Y-%m-%dT09:00:00Z'),
+                'hours': str(minutes // 60),
+                'minutes': str(minutes % 60),
+                'hoursDecimal': str(round(minutes / 60, 2)),
+                'description': 'Work {}'.format(record_id),
+                'todo-item-name': 'Task {}'.format(record_id % 50),
+                'isbillable': '1' if rnd.random() < 0.8 else '0',
+                'invoiceNo': '',
+                'invoiceStatus': '',
+                'updatedDate': date.strftime('%Y-%m-%dT18:00:00Z'),
+            })
+        data['time_entries'][project] = time_entries
+
+        expenses = []
+        for _ in range(rnd.randint(0, 12)):
+            record_id += 1
+            person = rnd.choice(members + [{'first-name': 'Unknown', 'last-name': 'Person'}])
+            date = start + datetime.timedelta(days=rnd.randrange(days))
+            expenses.append({
+                'id': str(record_id),
+                'name': person['first-name'] + ' ' + person['last-name'],
+                'date': date.strftime('%Y%m%d'),
+                'cost': '{}.{:02d}'.format(rnd.randint(1, 500), rnd.randint(0, 99)),
+                'description': 'Expense {}'.format(record_id),
+                'created-by-user-lastname': 'Manager',
+                'invoice-id': '',
+                'updatedDate': date.strftime('%Y-%m-%dT18:00:00Z'),
+            })
+        data['expenses'][project] = expenses
+
+    return data
+
+
+# updatedAfterDate (YYYYMMDDHHMMSS) compared with updatedDate of record
+
+def updated_after(record, value):
+    return record.get('updatedDate', '').replace('-', '').replace('T', '').replace(':', '').rstrip('Z') > value
+
+
+# object with only fields of fields[...] parameter (and id), whole object without it
+
+def sparse(item, fields):
+    if not fields:
+        return item
+    names = set(fields.split(',')) | {'id'}
+    return {name: value for name, value in item.items() if name in names}
+
+
+def now_updated_date():
+    return datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+# data and behaviour of mock API, shared by request handler threads
+
+class MockTeamwork:
+
+    def __init__(self, data, latency=0.0, jitter=0.0, rate_limit=None, error_rate=0.0, no_billing=(), seed=1,
+                 lost_response_rate=0.0, v3=True):
+        self.data = data
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.lost_response_rate = lost_response_rate
+        self.v3 = v3
+        self.task_ids = {}  # task name -> id of v3 task (v1 entries have only names)
+        self.no_billing = set(no_billing)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.invoices = {}
+        self.next_invoice_id = 500000
+        self.window_start = ttime.monotonic()
+        self.window_requests = 0
+        self.stats = {'requests': 0, 'throttled': 0, 'errors': 0, 'lost_responses': 0, 'invoices': 0, 'lineitems': 0,
+                      'bytes_sent': 0}
+
+    # latency, rate limit and injected errors of one request: (status or None, headers)
+
+    def admit(self):
+        with self.lock:
+            self.stats['requests'] += 1
+            delay = self.latency + self.random.random() * self.jitter
+            headers = {}
+            status = None
+
+            if self.rate_limit:
+                now = ttime.monotonic()
+                if now - self.window_start >= 60:
+                    self.window_start = now
+                    self.window_requests = 0
+                self.window_requests += 1
+                reset = max(1, int(60 - (now - self.window_start)))
+                headers = {'X-RateLimit-Limit': str(self.rate_limit),
+                           'X-RateLimit-Remaining': str(max(0, self.rate_limit - self.window_requests)),
+                           'X-RateLimit-Reset': str(reset)}
+                if self.window_requests > self.rate_limit:
+                    self.stats['throttled'] += 1
+                    headers['Retry-After'] = str(reset)
+                    status = 429
+
+            if status is None and self.error_rate and self.random.random() < self.error_rate:
+                self.stats['errors'] += 1
+                status = self.random.choice((502, 503, 504))
+
+        if delay:
+            ttime.sleep(delay)
+        return status, headers
+
+    # status of done POST/PUT which response is lost (gateway error after processing), None if response is sent
+
+    def lost_response(self):
+        with self.lock:
+            if self.lost_response_rate and self.random.random() < self.lost_response_rate:
+                self.stats['lost_responses'] += 1
+                return self.random.choice((502, 504))
+        return None
+
+    def projects(self, query):
+        return {'STATUS': 'OK', 'projects': self.data['projects']}, {}
+
+    def people(self, query):
+        return self.page('people', self.data['people'], query)
+
+    def project_people(self, project, query):
+        ids = set(self.data['project_people'].get(project, ()))
+        return {'STATUS': 'OK', 'people': [person for person in self.data['people'] if person['id'] in ids]}, {}
+
+    def rates(self, project, query):
+        rates = self.data['rates'].get(project, {})
+        return {'STATUS': 'OK', 'rates': {'users': {person_id: {'rate': rate} for person_id, rate in rates.items()}}}, {}
+
+    def expenses(self, project, query):
+        with self.lock:
+            records = [dict(expense) for expense in self.data['expenses'].get(project, ())]
+        if 'updatedAfterDate' in query:
+            records = [expense for expense in records if updated_after(expense, query['updatedAfterDate'])]
+        if 'fromdate' in query:
+            records = [expense for expense in records if expense['date'] >= query['fromdate']]
+        if 'todate' in query:
+            records = [expense for expense in records if expense['date'] <= query['todate']]
+        if query.get('invoicedType') == 'noninvoiced':
+            records = [expense for expense in records if expense['invoice-id'] == '']
+        return self.page('expenses', records, query)
+
+    def time_entries(self, project, query):
+        with self.lock:
+            records = [dict(entry) for entry in self.data['time_entries'].get(project, ())]
+        if 'updatedAfterDate' in query:
+            records = [entry for entry in records if updated_after(entry, query['updatedAfterDate'])]
+        if query.get('billableType') == 'billable':
+            records = [entry for entry in records if entry['isbillable'] == '1']
+        if query.get('invoicedType') == 'noninvoiced':
+            records = [entry for entry in records if entry['invoiceNo'] == '']
+        if 'fromdate' in query:
+            records = [entry for entry in records if entry['date'][:10].replace('-', '') >= query['fromdate']]
+        if 'todate' in query:
+            records = [entry for entry in records if entry['date'][:10].replace('-', '') <= query['todate']]
+        return self.page('time-entries', records, query)
+
+    # v3 timelogs: the same entries in v3 model (minutes, timeLogged, userId, taskId, invoiceId...),
+    # only fields of fields[timelogs] if given, users and tasks of include as included objects.
+    # Without fields[...] whole objects are sent, with fields which main.py doesn't use
+
+    def timelogs(self, project, query):
+        if not self.v3:
+            return None, {}
+
+        # filters of v1 endpoint, all matching entries on one page
+        v1_query = {'pageSize': sys.maxsize}
+        if 'updatedAfter' in query:
+            v1_query['updatedAfterDate'] = query['updatedAfter'].replace('-', '').replace('T', '').replace(':', '').rstrip('Z')
+        for name in ('billableType', 'invoicedType'):
+            if name in query:
+                v1_query[name] = query[name]
+        if 'startDate' in query:
+            v1_query['fromdate'] = query['startDate'].replace('-', '')
+        if 'endDate' in query:
+            v1_query['todate'] = query['endDate'].replace('-', '')
+
+        entries, _ = self.time_entries(project, v1_query)
+        entries = entries['time-entries']
+        page_size = max(1, int(query.get('pageSize', DEFAULT_PAGE_SIZE)))
+        page = max(1, int(query.get('page', 1)))
+
+        timelogs, users, tasks = [], {}, {}
+        with self.lock:
+            for entry in entries[(page - 1) * page_size:page * page_size]:
+                task_id = self.task_ids.setdefault(entry['todo-item-name'], 900000 + len(self.task_ids))
+                timelogs.append({
+                    'id': int(entry['id']),
+                    'userId': int(entry['person-id']),
+                    'taskId': task_id,
+                    'projectId': int(entry['project-id']),
+                    'minutes': 60 * int(entry['hours']) + int(entry['minutes']),
+                    'timeLogged': entry['date'],
+                    'description': entry['description'],
+                    'billable': entry['isbillable'] == '1',
+                    'invoiceId': int(entry['invoiceNo']) if entry['invoiceNo'] else None,
+                    'hasStartTime': True,
+                    'dateCreated': entry['updatedDate'],
+                    'dateEdited': entry['updatedDate'],
+                    'loggedBy': int(entry['person-id']),
+                    'deskTicketId': None,
+                    'tagIds': None,
+                    'assignedTeamIds': None,
+                    'user': {'id': int(entry['person-id']), 'type': 'users'},
+                    'task': {'id': task_id, 'type': 'tasks'},
+                    'project': {'id': int(entry['project-id']), 'type': 'projects'},
+                })
+                users[entry['person-id']] = {'id': int(entry['person-id']), 'firstName': entry['person-first-name'],
+                                             'lastName': entry['person-last-name'], 'avatarUrl': '', 'email': '',
+                                             'isAdmin': False, 'companyId': 1}
+                tasks[str(task_id)] = {'id': task_id, 'name': entry['todo-item-name'], 'status': 'new',
+                                       'tasklistId': 1, 'description': '', 'priority': None}
+
+        included = {}
+        for kind, objects in (('users', users), ('tasks', tasks)):
+            if kind in query.get('include', '').split(','):
+                included[kind] = {key: sparse(item, query.get('fields[{}]'.format(kind))) for key, item in objects.items()}
+
+        meta = {'page': {'pageOffset': page - 1, 'pageSize': page_size, 'count': len(entries),
+                         'hasMore': page * page_size < len(entries)}}
+        return {'timelogs': [sparse(timelog, query.get('fields[timelogs]')) for timelog in timelogs],
+                'meta': meta, 'included': included}, {}
+
+    @staticmethod
+    def page(name, records, query):
+        page_size = max(1, int(query.get('pageSize', DEFAULT_PAGE_SIZE)))
+        page = max(1, int(query.get('page', 1)))
+        pages = max(1, (len(records) + page_size - 1) // page_size)
+        headers = {'X-Page': str(page), 'X-Pages': str(pages), 'X-Records': str(len(records))}
+        return {'STATUS': 'OK', name: records[(page - 1) * page_size:page * page_size]}, headers
+
+    def create_invoice(self, project, body):
+        if project in self.no_billing:
+            return None
+        with self.lock:
+            self.next_invoice_id += 1
+            invoice_id = str(self.next_invoice_id)
+            self.invoices[invoice_id] = {'project': project, 'invoice': body.get('invoice', {}), 'expenses': [], 'timelogs': []}
+            self.stats['invoices'] += 1
+        return {'STATUS': 'OK', 'id': invoice_id}
+
+    def invoice(self, invoice_id, query):
+        with self.lock:
+            invoice = self.invoices.get(invoice_id)
+            if invoice is None:
+                return None, {}
+            return {'STATUS': 'OK', 'invoice': dict(invoice['invoice'], **{
+                'id': invoice_id,
+                'project-id': invoice['project'],
+                'timelogs': [{'id': item} for item in invoice['timelogs']],
+                'expenses': [{'id': item} for item in invoice['expenses']]})}, {}
+
+    def add_lineitems(self, invoice_id, body):
+        add = body.get('lineitems', {}).get('add', {})
+        with self.lock:
+            invoice = self.invoices.get(invoice_id)
+            if invoice is None:
+                return None
+            updated = now_updated_date()
+            for kind, records, field in (('timelogs', self.data['time_entries'], 'invoiceNo'),
+                                         ('expenses', self.data['expenses'], 'invoice-id')):
+                ids = {item for item in add.get(kind, '').split(',') if item}
+                if not ids:
+                    continue
+                for record in records.get(invoice['project'], ()):
+                    if record['id'] in ids:
+                        record[field] = invoice_id
+                        record['updatedDate'] = updated
+                invoice[kind].extend(sorted(ids))
+            self.stats['lineitems'] += 1
+        return {'STATUS': 'OK'}
+
+
+class MockHandler(BaseHTTPRequestHandler):
+
+    api = None  # MockTeamwork, set by serve()
+    compress = True  # gzip responses for clients which accept it, set by serve()
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body, headers=None):
+        content = json.dumps(body).encode('utf8')
+        etag = '"{}"'.format(hashlib.md5(content).hexdigest())
+
+        # conditional GET as Teamwork does (for local cache of main.py)
+
+        if status == 200 and self.command == 'GET' and self.headers.get('If-None-Match') == etag:
+            status, content = 304, b''
+
+        compressed = (self.compress and len(content) >= GZIP_MIN_BYTES and
+                      'gzip' in self.headers.get('Accept-Encoding', ''))
+        if compressed:
+            content = gzip.compress(content, compresslevel=6)
+
+        with self.api.lock:
+            self.api.stats['bytes_sent'] += len(content)
+
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if status in (200, 304) and self.command == 'GET':
+            self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Vary', 'Accept-Encoding')
+        if compressed:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def handle_request(self, routes):
+        url = urlparse(self.path)
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+
+        # body is read before injected errors, so keep-alive connection stays usable
+
+        body = self.read_body() if self.command in ('POST', 'PUT') else None
+
+        status, headers = self.api.admit()
+        if status is not None:
+            return self.send_json(status, {'STATUS': 'Error', 'MESSAGE': 'injected'}, headers)
+
+        for pattern, handler in routes:
+            match = re.fullmatch(pattern, url.path)
+            if match:
+                if body is None:
+                    response, response_headers = handler(*match.groups(), query)
+                    if response is None:
+                        break
+                    return self.send_json(200, response, dict(headers, **response_headers))
+                response = handler(*match.groups(), body)
+                if response is None:
+                    return self.send_json(400, {'STATUS': 'Error', 'MESSAGE': 'rejected'}, headers)
+                lost = self.api.lost_response()
+                if lost is not None:
+                    return self.send_json(lost, {'STATUS': 'Error', 'MESSAGE': 'injected after processing'}, headers)
+                return self.send_json(201 if self.command == 'POST' else 200, response, headers)
+
+        if url.path == '/_stats.json':
+            return self.send_json(200, dict(self.api.stats), headers)
+
+        self.send_json(404, {'STATUS': 'Error', 'MESSAGE': 'not found'}, headers)
+
+    def do_GET(self):
+        self.handle_request([
+            (r'/projects\.json', self.api.projects),
+            (r'/people\.json', self.api.people),
+            (r'/projects/(\w+)/people\.json', self.api.project_people),
+            (r'/projects/(\w+)/rates\.json', self.api.rates),
+            (r'/projects/(\w+)/expenses\.json', self.api.expenses),
+            (r'/projects/(\w+)/time_entries\.json', self.api.time_entries),
+            (r'/invoices/(\w+)\.json', self.api.invoice),
+            (r'/projects/api/v3/projects/(\w+)/time\.json', self.api.timelogs),
+        ])
+
+    def do_POST(self):
+        self.handle_request([(r'/projects/(\w+)/invoices\.json', self.api.create_invoice)])
+
+    def do_PUT(self):
+        self.handle_request([(r'/invoices/(\w+)/lineitems\.json', self.api.add_lineitems)])
+
+
+def serve(api, port=8900, compress=True):
+    handler = type('Handler', (MockHandler,), {'api': api, 'compress': compress})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == '__main__':
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "", ["help", "port=", "fixture=", "dump=", "projects=", "people=", "entries=", "seed=", "latency=", "jitter=", "rate_limit=", "error_rate=", "lost_response_rate=", "no_billing=", "no_gzip", "no_v3"])
+    except getopt.GetoptError:
+        print_usage()
+        sys.exit(2)
+
+    PORT = 8900
+    FIXTURE = ''
+    DUMP = ''
+    PROJECTS = 20
+    PEOPLE = 30
+    ENTRIES = 1000
+    SEED = 1
+    LATENCY = 0.0
+    JITTER = 0.0
+    RATE_LIMIT = None
+    ERROR_RATE = 0.0
+    LOST_RESPONSE_RATE = 0.0
+    NO_BILLING = []
+    COMPRESS = True
+    V3 = True
+
+    for opt, arg in opts:
+        if opt == '--help':
+            print_help()
+            sys.exit(2)
+        elif opt == '--port':
+            PORT = int(arg)
+        elif opt == '--fixture':
+            FIXTURE = arg
+        elif opt == '--dump':
+            DUMP = arg
+        elif opt == '--projects':
+            PROJECTS = int(arg)
+        elif opt == '--people':
+            PEOPLE = int(arg)
+        elif opt == '--entries':
+            ENTRIES = int(arg)
+        elif opt == '--seed':
+            SEED = int(arg)
+        elif opt == '--latency':
+            LATENCY = float(arg) / 1000
+        elif opt == '--jitter':
+            JITTER = float(arg) / 1000
+        elif opt == '--rate_limit':
+            RATE_LIMIT = int(arg)
+        elif opt == '--error_rate':
+            ERROR_RATE = float(arg)
+        elif opt == '--lost_response_rate':
+            LOST_RESPONSE_RATE = float(arg)
+        elif opt == '--no_billing':
+            NO_BILLING = arg.split(',')
+        elif opt == '--no_gzip':
+            COMPRESS = False
+        elif opt == '--no_v3':
+            V3 = False
+        else:
+            print_usage()
+            sys.exit(2)
+
+    if FIXTURE:
+        with open(FIXTURE, encoding='utf8') as fixture_file:
+            DATA = json.load(fixture_file)
+    else:
+        DATA = synthetic_data(PROJECTS, PEOPLE, ENTRIES, SEED)
+
+    if DUMP:
+        with open(DUMP, 'w', encoding='utf8') as dump_file:
+            json.dump(DATA, dump_file, ensure_ascii=False, indent=1)
+
+    SERVER = serve(MockTeamwork(DATA, LATENCY, JITTER, RATE_LIMIT, ERROR_RATE, NO_BILLING, SEED, LOST_RESPONSE_RATE, V3), PORT, COMPRESS)
+
+    print('Mock Teamwork API on http://127.0.0.1:{} ({} projects, {} people, {} time entries)'.format(
+        PORT, len(DATA['projects']), len(DATA['people']), sum(len(entries) for entries in DATA['time_entries'].values())))
+
+    try:
+        SERVER.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        SERVER.server_close()
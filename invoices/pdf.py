@@ -1,54 +1,255 @@
+import atexit
+import functools
+import io
+import multiprocessing
 import os
 import platform
+import shutil
+import subprocess
+import tempfile
+import threading
+import time as ttime
+from concurrent.futures import ProcessPoolExecutor
 
 import jinja2
 import pdfkit
 
+PDFKIT_SETTINGS = {
+    'dpi': '96',
+    'image-dpi': '3500',
+    'image-quality': '94',
+    'page-size': 'A4',
+    'encoding': "UTF-8",
+    'margin-top': '1cm',
+    'margin-bottom': '1cm',
+    'margin-right': '1cm',
+    'margin-left': '1cm',
+    'quiet': '',
+    'disable-smart-shrinking': '',
+    'footer-left': '[page]/[topage]',
+}
 
-def generate_pdf(html, directory, filename):
-    pdfkit_settings = {
-        'dpi': '96',
-        'image-dpi': '3500',
-        'image-quality': '94',
-        'page-size': 'A4',
-        'encoding': "UTF-8",
-        'margin-top': '1cm',
-        'margin-bottom': '1cm',
-        'margin-right': '1cm',
-        'margin-left': '1cm',
-        'quiet': '',
-        'disable-smart-shrinking': '',
-        'footer-left': '[page]/[topage]',
-    }
+# wkhtmltopdf of platform, on Linux wrapper wkhtmltopdf.sh (the only place with path of wkhtmltopdf binary)
+
+def wkhtmltopdf_configuration():
     if platform.system() == 'Windows':
-        configuration = pdfkit.configuration(
+        return pdfkit.configuration(
             wkhtmltopdf=os.path.join(
                 os.path.dirname(os.path.abspath(__file__)),
                 'wkhtmltox', 'bin', 'wkhtmltopdf.exe'))
     elif platform.system() == 'Linux':
-        configuration = pdfkit.configuration(
+        return pdfkit.configuration(
             wkhtmltopdf=os.path.join(
                 os.path.dirname(os.path.abspath(__file__)),
                 'wkhtmltopdf.sh'))
     else:
-        configuration = pdfkit.configuration()
+        return pdfkit.configuration()
+
+
+def generate_pdf(html, directory, filename, renderer=None):
+    write_pdf([html], directory, filename, renderer=renderer)
+
+
+# renders invoice template straight into wkhtmltopdf: html goes to its stdin chunk by chunk
+# as template generates it, whole html string is never built.
+# Returns timings: seconds spent in template (html) and in wkhtmltopdf (pdf) and their sizes
 
+def render_pdf(values, directory, filename, renderer=None, bytecode_cache_dir=None):
+    timing = {'html_seconds': 0.0, 'html_bytes': 0}
+    started = ttime.perf_counter()
+    chunks = invoice_template(bytecode_cache_dir).generate(template_values(values))
+    write_pdf(timed_chunks(chunks, timing), directory, filename, renderer=renderer)
+    timing['pdf_seconds'] = ttime.perf_counter() - started - timing['html_seconds']
+    timing['pdf_bytes'] = os.path.getsize(os.path.join(directory, filename))
+    return timing
+
+
+def timed_chunks(chunks, timing):
+    chunks = iter(chunks)
+    while True:
+        started = ttime.perf_counter()
+        chunk = next(chunks, None)
+        timing['html_seconds'] += ttime.perf_counter() - started
+        if chunk is None:
+            return
+        timing['html_bytes'] += len(chunk.encode('utf-8'))
+        yield chunk
+
+
+def write_pdf(chunks, directory, filename, renderer=None):
     if directory and not os.path.exists(directory):
         os.makedirs(directory)
 
-    with open(os.path.join(directory, filename), 'wb') as pdf_file:
-        pdf_file.write(pdfkit.PDFKit(html, "string",
-                                     options=pdfkit_settings,
-                                     configuration=configuration).to_pdf())
+    configuration = wkhtmltopdf_configuration()
+    env = None
+
+    # wkhtmltopdf.sh runs wkhtmltopdf on display of renderer instead of starting xvfb-run
+
+    if renderer is not None and renderer.display:
+        env = dict(os.environ, WKHTMLTOPDF_DISPLAY=renderer.display)
+
+    path = os.path.join(directory, filename)
+    command = pdfkit.PDFKit('', "string", options=PDFKIT_SETTINGS, configuration=configuration).command(path)
+
+    # stderr goes to file, so wkhtmltopdf never blocks on full pipe while we are writing to its stdin
+
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=stderr, env=env)
+        stdin = io.TextIOWrapper(process.stdin, encoding='utf-8')
+        try:
+            for chunk in chunks:
+                stdin.write(chunk)
+            stdin.close()
+        except BrokenPipeError:
+            pass
+        exit_code = process.wait()
+
+        if exit_code != 0 or not os.path.exists(path) or not os.path.getsize(path):
+            stderr.seek(0)
+            raise IOError("wkhtmltopdf exited with non-zero code {0}. error:\n{1}".format(
+                exit_code, stderr.read().decode('utf-8', 'replace')))
+
+
+# renders pdfs for the whole run with one X server: on Linux wkhtmltopdf.sh starts new xvfb-run (X server)
+# for every pdf, renderer starts one Xvfb display and wkhtmltopdf.sh runs wkhtmltopdf on it.
+# wkhtmltopdf itself is still one process per pdf (one call writes one pdf file), only X server is shared.
+# Where Xvfb isn't needed or isn't installed (Windows, MacOS) display stays None and write_pdf works as before
+
+class PdfRenderer:
+
+    def __init__(self, display=None):
+        self.display = display
+        self.xvfb = None
+
+    def start(self):
+        xvfb = shutil.which('Xvfb')
+        if platform.system() != 'Linux' or not xvfb:
+            return self
+
+        # Xvfb picks free display itself and writes its number to displayfd when ready to accept clients
+
+        read_fd, write_fd = os.pipe()
+        self.xvfb = subprocess.Popen(
+            [xvfb, '-displayfd', str(write_fd), '-screen', '0', '1024x768x24', '-nolisten', 'tcp'],
+            pass_fds=(write_fd,), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        os.close(write_fd)
+        with os.fdopen(read_fd) as display_pipe:
+            display = display_pipe.readline().strip()
+
+        if not display:
+            self.stop()
+            return self
 
+        self.display = ':' + display
+        atexit.register(self.stop)
+        return self
 
-def generate_html(values):
+    def stop(self):
+        if self.xvfb is not None:
+            self.xvfb.terminate()
+            self.xvfb.wait()
+            self.xvfb = None
+        self.display = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+# renders one invoice in worker process of RenderQueue, on display of parent's renderer
+
+def render_invoice(values, directory, filename, display, bytecode_cache_dir):
+    return render_pdf(values, directory, filename, renderer=PdfRenderer(display),
+               bytecode_cache_dir=bytecode_cache_dir)
+
+
+# pdfs are rendered by pool of worker processes while caller goes on (API calls etc),
+# join() waits for all jobs and returns failed ones with their exceptions, results of successful ones
+# (timings of render_pdf) are in results. wait() does the same, but keeps workers (with compiled template)
+# for next jobs, reset() forgets jobs of previous wait() - so one queue serves all runs of service.
+# Workers are spawned (not forked), because caller usually has running threads
+
+class RenderQueue:
+
+    def __init__(self, renderer, workers=1, bytecode_cache_dir=None):
+        self.renderer = renderer
+        self.bytecode_cache_dir = bytecode_cache_dir
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        self.jobs = []
+        self.results = []
+        self.pending = 0  # jobs whose on_done isn't called yet
+        self.lock = threading.Condition()
+
+    # context is anything caller needs to report job failure (project, person etc),
+    # on_done is called (in background thread) when pdf is written
+
+    def submit(self, values, directory, filename, context=None, on_done=None):
+        future = self.executor.submit(render_invoice, values, directory, filename,
+                                      self.renderer.display, self.bytecode_cache_dir)
+        with self.lock:
+            self.jobs.append((future, context))
+            self.pending += 1
+        future.add_done_callback(functools.partial(self.done, on_done))
+
+    def done(self, on_done, future):
+        try:
+            if on_done and future.exception() is None:
+                on_done()
+        finally:
+            with self.lock:
+                self.pending -= 1
+                self.lock.notify_all()
+
+    def wait(self):
+        with self.lock:
+            self.lock.wait_for(lambda: not self.pending)
+            jobs = list(self.jobs)
+
+        failed = []
+        for future, context in jobs:
+            exception = future.exception()
+            if exception is not None:
+                failed.append((context, exception))
+            else:
+                self.results.append((context, future.result()))
+        return failed
+
+    def join(self):
+        failed = self.wait()
+        self.executor.shutdown(wait=True)
+        return failed
+
+    def reset(self):
+        with self.lock:
+            self.jobs = []
+            self.results = []
+
+
+# jinja environment and compiled invoice.html - once per process,
+# compiled template may be also cached between runs in bytecode_cache_dir
+
+@functools.lru_cache(maxsize=None)
+def invoice_template(bytecode_cache_dir=None):
     path = os.path.join(os.path.dirname(__file__), 'templates')
-    template = jinja2.Environment(
-        loader=jinja2.FileSystemLoader(path)).get_template(
+    bytecode_cache = None
+    if bytecode_cache_dir:
+        os.makedirs(bytecode_cache_dir, exist_ok=True)
+        bytecode_cache = jinja2.FileSystemBytecodeCache(bytecode_cache_dir)
+    return jinja2.Environment(
+        loader=jinja2.FileSystemLoader(path),
+        bytecode_cache=bytecode_cache).get_template(
         'invoice.html')
+
+
+def template_values(values):
     values['dateformat'] = "%02d/%02m/%Y" if platform.system() == 'Linux' else "%d/%m/%Y"
-    return template.render(values)
+    return values
+
+
+def generate_html(values, bytecode_cache_dir=None):
+    return invoice_template(bytecode_cache_dir).render(template_values(values))
 
 
 if __name__ == '__main__':
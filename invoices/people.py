@@ -0,0 +1,40 @@
+# company wide directory of people, loaded once per run from paged /people.json
+# full name -> ids index keeps all ids of the name, so duplicate full names are never resolved silently
+
+class PeopleDirectory:
+
+    def __init__(self):
+        self.names_by_id = {}
+        self.ids_by_name = {}
+
+    def add(self, person_id, full_name):
+        if person_id in self.names_by_id:
+            return
+        self.names_by_id[person_id] = full_name
+        self.ids_by_name.setdefault(full_name, []).append(person_id)
+
+    def add_page(self, peoples):
+        for people in peoples['people']:
+            self.add(people['id'], full_name(people))
+
+    def ids(self, name):
+        return self.ids_by_name.get(name, [])
+
+    def is_ambiguous(self, name):
+        return len(self.ids(name)) > 1
+
+    # id of person with full name or None if there is no such person or name is ambiguous
+    # (then members - ids of people who may be meant, e.g. people of project - can decide)
+
+    def person_id(self, name, members=None):
+        ids = self.ids(name)
+        if members is not None and len(ids) > 1:
+            ids = [person_id for person_id in ids if person_id in members]
+        return ids[0] if len(ids) == 1 else None
+
+    def duplicates(self):
+        return {name: ids for name, ids in self.ids_by_name.items() if len(ids) > 1}
+
+
+def full_name(people):
+    return people['first-name'] + ' ' + people['last-name']
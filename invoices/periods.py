@@ -0,0 +1,62 @@
+import calendar
+import datetime
+
+# billing periods of run (--periods): (start, end) dates in YYYYMMDD format, in order of dates.
+# Run fetches records of union window of periods once and splits them into periods in memory
+
+
+def parse_periods(value):
+    periods = []
+
+    for part in value.split(','):
+
+        if '-' in part:
+            start, end = part.split('-', 1)
+            datetime.datetime.strptime(start, '%Y%m%d')
+            datetime.datetime.strptime(end, '%Y%m%d')
+        else:
+            # whole month YYYYMM
+            month = datetime.datetime.strptime(part, '%Y%m')
+            start = month.strftime('%Y%m%d')
+            end = month.replace(day=calendar.monthrange(month.year, month.month)[1]).strftime('%Y%m%d')
+
+        if start > end:
+            raise ValueError('start of period {} is after its end'.format(part))
+
+        periods.append((start, end))
+
+    periods.sort()
+
+    # record can't be invoiced twice, so periods don't overlap
+
+    for previous, period in zip(periods, periods[1:]):
+        if period[0] <= previous[1]:
+            raise ValueError('periods {} and {} overlap'.format(period_label(previous), period_label(period)))
+
+    return periods
+
+
+# dates window (start, end) which covers all periods
+
+def union_window(periods):
+    return periods[0][0], max(end for _, end in periods)
+
+
+def period_label(period):
+    return '{}-{}'.format(*period)
+
+
+# records split into periods by date (YYYYMMDD) of record, period -> records in order they came,
+# records in gaps between periods are dropped
+
+def split_by_period(records, date_of, periods):
+    buckets = {period: [] for period in periods}
+
+    for record in records:
+        date = date_of(record)
+        for period in periods:
+            if period[0] <= date <= period[1]:
+                buckets[period].append(record)
+                break
+
+    return buckets
@@ -0,0 +1,1430 @@
+import datetime
+import functools
+import logging
+import os
+import threading
+import time as ttime
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests.exceptions
+from api import TeamworkClient
+from cache import ResponseCache
+from costs import aggregate_time_entries, cents_to_money, money_cents
+from journal import JOURNALED_RESULT_KEYS, ResumeState, RunJournal, invoice_key, journaled_result, pdf_values
+from metrics import Metrics
+from pdf import PdfRenderer, RenderQueue
+from people import PeopleDirectory
+from periods import period_label, split_by_period, union_window
+from ratelimit import limiter_for, parse_rate_limits
+from reconcile import Ledger, lost_by_person
+from store import SyncStore
+
+# run of invoices as importable pipeline (main.py is its command line, service.py and schedulers run it in process):
+# fetch (projects, people, expenses, rates, time entries) -> normalize (not invoiced items of period, persons of
+# fixed expenses) -> aggregate (per person totals in cents) -> invoice (invoices through API) -> render (pdfs)
+# -> report (report.txt, lost.txt). Stages are methods of InvoiceRun and pass records of classes below,
+# so subclass (or caller) can profile, cache or parallelize every stage on its own
+
+PAGE_SIZE = 500  # param for getting 500 entries per API page
+
+# incremental sync asks API for records updated a bit earlier than last sync, for clock difference with API server
+
+SYNC_OVERLAP = datetime.timedelta(minutes=5)
+
+
+# run can't go on (error is already in errors.txt), exit_code - for command line
+
+class RunError(Exception):
+
+    def __init__(self, message, exit_code=1):
+        super().__init__(message)
+        self.exit_code = exit_code
+
+
+# settings of run (arguments of main.py). project_ids - ids or ['all_projects'],
+# periods - billing periods (start, end) in YYYYMMDD format, in order of dates
+
+class RunConfig:
+
+    def __init__(self, domain, apikey, project_ids, periods, logdir, exclude_project_ids=(), pdfdir='',
+                 check_lost=False, timeout=60, retries=5, rate_limit='', workers=1, page_workers=4, pdf_workers=2,
+                 invoice_workers=4, template_cache=None, cachedir='', cache_ttl=86400, no_cache=False, refresh=False,
+                 incremental=False, resume=False, metrics_textfile=''):
+        self.domain = domain
+        self.apikey = apikey
+        self.project_ids = list(project_ids)
+        self.exclude_project_ids = list(exclude_project_ids)
+        self.periods = list(periods)
+        self.logdir = logdir
+        self.pdfdir = pdfdir
+        self.check_lost = check_lost
+        self.timeout = timeout
+        self.retries = retries
+        self.rate_limit = rate_limit
+        self.workers = workers
+        self.page_workers = page_workers
+        self.pdf_workers = pdf_workers
+        self.invoice_workers = invoice_workers
+        self.template_cache = template_cache
+        self.cachedir = cachedir
+        self.cache_ttl = cache_ttl
+        self.no_cache = no_cache
+        self.refresh = refresh
+        self.incremental = incremental
+        self.resume = resume
+        self.metrics_textfile = metrics_textfile
+
+        # dates of run - window from the first to the last period
+
+        self.start_date, self.end_date = union_window(self.periods)
+
+
+# log.txt of run and errors.txt in logdir (errors.txt is created with first error).
+# Loggers "main" and "errors" are shared by process, run adds its file handlers to them and removes them on close
+
+class RunLogs:
+
+    def __init__(self, logdir):
+        self.path = Path(logdir)
+        self.lock = threading.Lock()  # errors.txt logger is initiated from concurrent project workers
+        self.errors = None
+        self.handlers = []  # (logger, handler) of this run
+
+        self.log = logging.getLogger("main")
+        self.log.setLevel(logging.DEBUG)
+        self.add_handler(self.log, 'log.txt')
+
+    def error(self, error_msg):
+        with self.lock:
+            if self.errors is None:
+                self.errors = logging.getLogger("errors")
+                self.errors.setLevel(logging.DEBUG)
+                self.add_handler(self.errors, 'errors.txt')
+
+        self.errors.error(error_msg)
+
+    def add_handler(self, logger, filename):
+        handler = log_file(self.path / filename)
+        logger.addHandler(handler)
+        self.handlers.append((logger, handler))
+
+    # log files of run are closed, so next run in the same process writes only to its own logdir
+
+    def close(self):
+        for logger, handler in self.handlers:
+            logger.removeHandler(handler)
+            handler.close()
+        self.handlers = []
+
+
+def log_file(path):
+    handler = logging.FileHandler(path, encoding='utf8')
+    handler.setFormatter(logging.Formatter('%(name)s [%(asctime)s] - %(message)s'))
+    return handler
+
+
+# fetch: records of project for all periods of run. Expenses are fetched at once, rates, members and time entries
+# when period needs them (rates - only for project with billing); time entries of several periods
+# are fetched once and split into periods
+
+class ProjectRecords:
+
+    def __init__(self, project, expenses_by_period):
+        self.project = project
+        self.expenses_by_period = expenses_by_period  # period -> expenses (dicts of API)
+        self.members = None  # ids of project people, for fixed expenses of ambiguous names
+        self.rates = None  # person id -> rate
+        self.time_entries_by_period = None  # period -> time entries, with several periods
+
+
+# normalize: not invoiced expense of period with identified person
+
+class FixedExpense:
+
+    def __init__(self, expense_id, person_id, cost):
+        self.id = expense_id
+        self.person_id = person_id
+        self.cost = cost
+
+
+# invoice of one person: number, line items for API, journal record of invoice (project, period, kind, person, items...)
+
+class InvoiceSpec:
+
+    def __init__(self, number, lineitems, journal):
+        self.number = number
+        self.lineitems = lineitems
+        self.journal = journal
+
+
+# result of project for one period: what report.txt, invoices summary and --check-lost take from it
+
+class PeriodResult:
+
+    def __init__(self, project, period, ledger=None):
+        self.project = project
+        self.period = period
+        self.billing = False
+        self.expenses_cost = []  # (person id, cost) in order of processing
+        self.rates = {}  # person id -> rate for this project
+        self.time_by_person = {}  # person id -> minutes
+        self.cost_cents_by_person = {}  # person id -> cost in cents
+        self.invoices = []  # (invoice number, invoice id or None, error or None) in order of creation
+        self.ledger = ledger  # items to invoice and invoiced items for --check-lost
+
+    # result of project done in resumed run (ledger - if lost items were journaled, run was with --check-lost)
+
+    @classmethod
+    def from_journal(cls, record):
+        result = cls(record['project'], tuple(record['period']))
+        if 'lost' in record:
+            result.ledger = Ledger.from_journal(record['project'], record['lost'])
+        for key in JOURNALED_RESULT_KEYS:
+            if key not in ('project', 'period'):
+                setattr(result, key, record[key])
+        return result
+
+
+# report: totals of period over all projects, results are added in projects order
+
+class PeriodReport:
+
+    def __init__(self, period):
+        self.period = period
+        self.expenses_cents_by_user = {}
+        self.rates_for_users_per_project = {}
+        self.time_for_users_per_project = {}
+        self.cost_cents_for_users_per_project = {}
+
+    def add(self, result):
+
+        # summarazing expenses per user across all projects for report.txt
+
+        for expense_user_id, expense_cost in result.expenses_cost:
+            self.expenses_cents_by_user[expense_user_id] = self.expenses_cents_by_user.get(expense_user_id, 0) + money_cents(expense_cost)
+
+        if not result.billing:
+            return
+
+        for key, rate in result.rates.items():
+
+            if key not in self.rates_for_users_per_project:
+                self.rates_for_users_per_project[key] = {}
+
+            self.rates_for_users_per_project[key][result.project] = rate
+
+        # summary costs and time
+
+        for person_id, cost_cents in result.cost_cents_by_person.items():
+            self.cost_cents_for_users_per_project[person_id] = self.cost_cents_for_users_per_project.get(person_id, 0) + cost_cents
+
+        for person_id, total_minutes in result.time_by_person.items():
+            self.time_for_users_per_project[person_id] = self.time_for_users_per_project.get(person_id, 0) + total_minutes
+
+    # rows of report.txt table: id, name, hours, cost, expenses, rates of people who have any of them
+
+    def rows(self, people_names_by_id):
+
+        x = []
+
+        for key, val in people_names_by_id.items():
+
+            person_id = key
+            person_name = val
+            person_time = 0.00
+            person_cost = 0.00
+            person_expenses = 0.00
+            person_rates = ''
+
+            if person_id in self.time_for_users_per_project:
+                person_time = round(self.time_for_users_per_project[person_id]/60, 2)
+
+            if person_id in self.cost_cents_for_users_per_project:
+                person_cost = cents_to_money(self.cost_cents_for_users_per_project[person_id])
+
+            if person_id in self.expenses_cents_by_user:
+                person_expenses = cents_to_money(self.expenses_cents_by_user[person_id])
+
+            if person_time == 0 and person_cost == 0 and person_expenses == 0:
+                continue
+
+            if person_id in self.rates_for_users_per_project:
+
+                rates_for_person = self.rates_for_users_per_project[person_id]
+
+                rates_for_person_values = list(rates_for_person.values())
+
+                if len(set(rates_for_person_values)) == 1:
+
+                    person_rates = "all projects: {} usd/hour".format(rates_for_person_values[0])
+
+                else:
+
+                    for key, val in self.rates_for_users_per_project[person_id].items():
+
+                        person_rates += ' project ID:{}: {} usd/hour,'.format(key, val)
+
+                    if person_rates[len(person_rates) - 1] == ',':
+
+                        person_rates = person_rates[:-1]
+
+                    if person_rates[0] == ' ':
+
+                        person_rates = person_rates[1:]
+
+            x.append([str(person_id), str(person_name), str(person_time), str(person_cost), str(person_expenses), person_rates])
+
+        return x
+
+
+# only billable and not yet invoiced entries
+
+def uninvoiced_billable(entries):
+
+    for entrie in entries:
+        if (entrie.invoice_no == '' and
+                entrie.invoice_status == '' and
+                entrie.billable):
+            yield entrie
+
+# each entry once (entry may be returned twice if entries changed between pages requests),
+# without entries already in invoices of resumed run, recorded in --check-lost ledger
+
+def new_time_entries(entries, invoiced_ids, ledger=None):
+
+    seen_ids = set()
+
+    for entrie in entries:
+
+        if entrie.id in seen_ids:
+            continue
+
+        seen_ids.add(entrie.id)
+
+        if entrie.id in invoiced_ids:
+            continue
+
+        if ledger:
+            ledger.expect('time_entries', entrie.id, entrie.person_id, entrie)
+
+        yield entrie
+
+# invoice refused by API for good (4xx, except rate limit 429 after all retries): project has no billing option
+
+def invoice_rejected(response):
+    return response is not None and 400 <= response.status_code < 500 and response.status_code != 429
+
+# date of invoices created now
+
+def invoice_date():
+    return datetime.datetime.strftime(datetime.datetime.utcnow(), '%Y%m%d')
+
+
+# one run of invoices: resources of run (http client, cache, store, journal, pdf queue, metrics, logs) and its stages.
+# warm - state which outlives runs in service mode (service.py: http clients, cache, pdf render queue and display)
+
+class InvoiceRun:
+
+    def __init__(self, config, logs=None, warm=None):
+        self.config = config
+        self.own_logs = logs is None  # logs created by run are closed with it, passed ones - by caller
+        self.logs = logs or RunLogs(config.logdir)
+        self.log = self.logs.log
+        self.warm = warm
+        self.periods = config.periods
+        self.start_date, self.end_date = config.start_date, config.end_date
+
+        # shared http client (connection pool, timeouts, retries) for all Teamwork API calls
+
+        rate_limits = parse_rate_limits(config.rate_limit, config.domain) if config.rate_limit else {}
+
+        self.limiter = limiter_for(config.domain, rate_limits.get(config.domain.rstrip('/')))
+
+        # limiter of domain lives as long as process (all runs of service), run logs only its own waiting
+
+        self.throttled_before = self.limiter.throttled, self.limiter.throttled_requests
+
+        # local cache of API responses (people, rates, projects list, expenses)
+
+        if config.cachedir and not os.path.exists(config.cachedir):
+            os.makedirs(config.cachedir)
+
+        self.cache = None
+
+        if not config.no_cache and warm:
+            self.cache = warm.cache(Path(config.cachedir or config.logdir) / 'cache.sqlite', refresh=config.refresh)
+        elif not config.no_cache:
+            self.cache = ResponseCache(Path(config.cachedir or config.logdir) / 'cache.sqlite', refresh=config.refresh)
+
+        # local store of time entries, expenses and invoices for incremental sync
+
+        self.store = None
+
+        if config.incremental:
+            self.store = SyncStore(Path(config.cachedir or config.logdir) / 'store.sqlite')
+
+        # timings, counters and bytes of phases and API requests (metrics.json in logdir, metrics textfile)
+
+        self.metrics = Metrics()
+
+        # in service mode connection pool of domain stays open between runs
+
+        pool_size = max(10, config.workers * max(config.page_workers, config.invoice_workers))
+
+        if warm:
+            self.client = warm.client(config.domain, config.apikey, timeout=config.timeout, retries=config.retries, limiter=self.limiter, pool_size=pool_size, cache=self.cache, metrics=self.metrics)
+        else:
+            self.client = TeamworkClient(config.domain, config.apikey, timeout=config.timeout, retries=config.retries, limiter=self.limiter, pool_size=pool_size, cache=self.cache, metrics=self.metrics)
+
+        # one X server display for all pdfs of the run (Linux), in service mode - for all runs,
+        # and so are worker processes of pdfs with compiled template
+
+        self.renderer = warm.renderer if warm else PdfRenderer()
+
+        self.pdf_queue = None
+
+        if config.pdfdir and warm:
+            self.pdf_queue = warm.render_queue(config.pdf_workers, config.template_cache)
+        elif config.pdfdir:
+            self.renderer.start()
+            self.pdf_queue = RenderQueue(self.renderer, config.pdf_workers, bytecode_cache_dir=config.template_cache)
+
+        self.journal = RunJournal(self.logs.path / 'journal.jsonl')
+        self.resume = ResumeState()
+        self.people = None
+
+    def log_error(self, error_msg):
+        self.logs.error(error_msg)
+
+    # error after which run can't go on
+
+    def fail(self, error_msg, exit_code=1):
+        self.log_error(error_msg)
+        raise RunError(error_msg, exit_code)
+
+    # whole run, returns its summary
+
+    def run(self):
+        try:
+            self.open_journal()
+
+            project_ids = self.fetch_project_ids()
+
+            self.people = self.fetch_people()
+
+            reports = {period: PeriodReport(period) for period in self.periods}
+
+            ledgers = []
+
+            invoices_created = 0
+            invoices_failed = 0
+
+            # projects are processed concurrently by workers threads (or one by one with one worker),
+            # results are merged strictly in projects order, so report.txt is the same as for serial run
+
+            executor = None
+            futures = []
+
+            if self.config.workers > 1:
+                executor = ThreadPoolExecutor(max_workers=self.config.workers)
+                futures = [executor.submit(self.process_project, PROJECT) for PROJECT in project_ids]
+                project_results = (future.result() for future in futures)
+            else:
+                project_results = map(self.process_project, project_ids)
+
+            try:
+                for results in project_results:
+
+                    for result in results:
+
+                        reports[result.period].add(result)
+
+                        if result.ledger:
+                            ledgers.append(result.ledger)
+
+                        # summary of invoices of project
+
+                        for number, invoice_id, error in result.invoices:
+                            if error:
+                                invoices_failed += 1
+                                self.log.info('Счет {} проекта {}: ошибка ({}), invoice {}'.format(number, result.project, error, invoice_id))
+                            else:
+                                invoices_created += 1
+                                self.log.info('Счет {} проекта {}: создан, invoice {}'.format(number, result.project, invoice_id))
+            finally:
+                if executor:
+                    # after error projects which aren't started yet are cancelled (python 3.8 has no shutdown(cancel_futures))
+                    for future in futures:
+                        future.cancel()
+                    executor.shutdown()
+
+            self.log.info('Счета созданы: {}, с ошибками: {}'.format(invoices_created, invoices_failed))
+
+            pdf_failed = self.wait_pdfs()
+
+            header = self.report_header(project_ids)
+
+            self.write_report(header, [reports[period] for period in self.periods])
+
+            if self.config.check_lost:
+                self.write_lost(header, ledgers)
+
+            self.finish()
+
+            return {
+                'projects': len(project_ids),
+                'invoices_created': invoices_created,
+                'invoices_failed': invoices_failed,
+                'pdf_failed': len(pdf_failed),
+                'seconds': self.metrics.summary()['seconds'],
+            }
+        finally:
+            self.close()
+
+    # journal of completed steps, resumed run continues last run with the same domain, dates and periods
+
+    def open_journal(self):
+        labels = [period_label(period) for period in self.periods]
+
+        if self.config.resume:
+
+            last_run = self.journal.last_run()
+
+            if not last_run or (last_run[0]['domain'], last_run[0]['start_date'], last_run[0]['end_date'], last_run[0]['periods']) != (self.config.domain, self.start_date, self.end_date, labels):
+                self.fail('Ошибка: в журнале нет запуска с такими же domain, start_date, end_date и periods для --resume', 2)
+
+            self.resume = ResumeState(last_run)
+
+            self.log.info('Продолжаем запуск: проектов обработано {}, счетов без позиций {}, PDF не сформировано {}'.format(len(self.resume.projects), len(self.resume.created), len(self.resume.pdfs)))
+
+        self.journal.open()
+
+        if self.config.resume:
+            self.journal.write('resume', started_at=datetime.datetime.now())
+        else:
+            self.journal.write('run', domain=self.config.domain, start_date=self.start_date, end_date=self.end_date,
+                               periods=labels, started_at=datetime.datetime.now())
+
+        # pdfs of resumed run which weren't written before crash
+
+        for pdf_record in self.resume.pdfs.values():
+
+            if not self.pdf_queue:
+                self.log_error('PDF не сформирован в прерванном запуске, для продолжения нужен --pdfdir (project {}, person {})'.format(pdf_record['project'], pdf_record['person']))
+                continue
+
+            self.submit_pdf(dict(pdf_record, values=pdf_values(pdf_record['values'])))
+
+    # fetch stage
+
+    # ids of projects of run (all active projects for 'all_projects'), without excluded ones
+
+    def fetch_project_ids(self):
+
+        project_ids = self.config.project_ids
+
+        if ( len(project_ids) == 1 ) and ( project_ids[0] == 'all_projects' ):
+
+            self.log.info('Получаем список проектов, так как указан ключ all_projects')
+
+            with self.metrics.phase('fetch_projects'):
+                response = self.client.get(
+                    '/projects.json',
+                    params={'status':'ACTIVE'},
+                    cache_ttl=self.config.cache_ttl)
+
+            all_projects = response.json()
+
+            if 'projects' not in all_projects:
+                self.fail('Ошибка ответа от API (get all projects)! Аварийное завершение.')
+
+            project_ids = [proj['id'] for proj in all_projects['projects']]
+
+        exclude_project_ids = self.config.exclude_project_ids
+
+        project_ids = [prj for prj in project_ids if str(prj) not in exclude_project_ids or prj not in exclude_project_ids]
+
+        return [str(prj).strip() for prj in project_ids]
+
+    # company people once (persons id -> persons name for report.txt, full name -> ids for fixed expenses)
+
+    def fetch_people(self):
+
+        self.log.info('Получаем список сотрудников')
+
+        people = PeopleDirectory()
+
+        with self.metrics.phase('fetch_people'):
+
+            for people_page, peoples in self.client.iter_pages('/people.json', params={'pageSize': PAGE_SIZE}, max_workers=self.config.page_workers, cache_ttl=self.config.cache_ttl):
+
+                if 'people' not in peoples:
+                    self.fail('Ошибка ответа от API (get peoples, page {})! Аварийное завершение.'.format(people_page))
+
+                people.add_page(peoples)
+
+        for full_name, person_ids in people.duplicates().items():
+            self.log.info('Несколько сотрудников с именем {} (id {}), фиксированные расходы определяются по участникам проекта'.format(full_name, ', '.join(person_ids)))
+
+        return people
+
+    # expenses of project for all periods
+
+    def fetch_project(self, PROJECT):
+
+        self.log.info('Получаем фиксированные затраты для проекта за период')
+
+        with self.metrics.phase('fetch_expenses'):
+            expenses = list(self.project_expenses(PROJECT))
+
+        return ProjectRecords(PROJECT, split_by_period(expenses, lambda expense: expense['date'], self.periods))
+
+    # ids of project people - only when full name of fixed expense belongs to several people
+
+    def fetch_project_members(self, records):
+
+        if records.members is None:
+
+            self.log.info('Получаем список сотрудников для проекта {}'.format(records.project))
+
+            with self.metrics.phase('fetch_project_people'):
+                response = self.client.get('/projects/' + records.project + '/people.json', cache_ttl=self.config.cache_ttl)
+
+            peoples = response.json()
+
+            if 'people' not in peoples:
+                self.fail('Ошибка ответа от API (get peoples for project, project {})! Аварийное завершение.'.format(records.project))
+
+            records.members = {people['id'] for people in peoples['people']}
+
+        return records.members
+
+    # rates of people in project: person id -> rate (once for all periods)
+
+    def fetch_rates(self, records):
+
+        if records.rates is None:
+
+            # rates are always revalidated (like expenses): money of report.txt and pdfs is counted from them,
+            # rate changed today must not wait for --cache_ttl
+
+            with self.metrics.phase('fetch_rates'):
+                response = self.client.get('/projects/' + records.project + '/rates.json', cache_ttl=0)
+
+            rates = response.json()
+
+            if rates['STATUS'] != 'OK':
+                self.fail('Ошибка ответа от API (get rates for people in project, project {})! Аварийное завершение.'.format(records.project))
+
+            records.rates = {}
+
+            if 'rates' in rates:
+                if 'users' in rates['rates']:
+                    for key, value in rates['rates']['users'].items():
+                        records.rates[key] = value['rate']
+
+        return records.rates
+
+    # billable and not invoiced time entries of project in period. With one period they go page by page, as they are
+    # fetched; with several periods entries of union window are fetched once (for first period) and split into periods
+
+    def fetch_time_entries(self, records, period):
+
+        if len(self.periods) == 1:
+            return uninvoiced_billable(self.project_time_entries(records.project))
+
+        if records.time_entries_by_period is None:
+            records.time_entries_by_period = split_by_period(uninvoiced_billable(self.project_time_entries(records.project)), lambda entrie: entrie.day, self.periods)
+
+        return records.time_entries_by_period[period]
+
+    # time entries of project page by page (pages are fetched concurrently)
+    # (billable and not invoiced of dates of the run or, with updated_after, all entries changed since then).
+    # Client takes them from v3 timelogs with sparse fieldsets or from v1 time_entries, pages are the same
+
+    def iter_time_entries(self, PROJECT, updated_after=None):
+
+        time_pages = self.client.iter_time_entries(
+            PROJECT,
+            start_date=self.start_date,
+            end_date=self.end_date,
+            updated_after=updated_after,
+            page_size=PAGE_SIZE,
+            max_workers=self.config.page_workers)
+
+        # entries of pages are compact TimeEntry records (see entries.py), not dicts of response
+
+        for time_page, time_temp in time_pages:
+
+            if time_temp['STATUS'] != 'OK':
+                self.fail('Ошибка ответа от API (get time entries for project, project {}, page {})! Аварийное завершение.'.format(PROJECT, time_page))
+
+            yield from time_temp['time-entries']
+
+    # expenses of project page by page, the same way as time entries
+    # (not invoiced of dates of the run or, with updated_after, all expenses changed since then)
+
+    def iter_expenses(self, PROJECT, updated_after=None):
+
+        if updated_after:
+            params = {'updatedAfterDate': updated_after,
+                      'pageSize': PAGE_SIZE}
+        else:
+            params = {'invoicedType': 'noninvoiced',
+                      'fromdate': self.start_date,
+                      'todate': self.end_date,
+                      'pageSize': PAGE_SIZE}
+
+        # expenses are always revalidated: cached expense may be already invoiced
+
+        expense_pages = self.client.iter_pages(
+            '/projects/' + PROJECT + '/expenses.json',
+            params=params,
+            max_workers=self.config.page_workers,
+            cache_ttl=None if updated_after else 0)
+
+        for expense_page, expenses in expense_pages:
+
+            if 'expenses' not in expenses:
+                self.fail('Ошибка ответа от API (get fixed expenses for project, project {}, page {})! Аварийное завершение.'.format(PROJECT, expense_page))
+
+            yield from expenses['expenses']
+
+    # --incremental: brings records of project in store up to date - only changed records if store already has
+    # records of dates window, otherwise all records of window
+
+    def sync_records(self, PROJECT, kind, fetch):
+
+        domain = self.config.domain
+
+        start_date, end_date = self.start_date, self.end_date
+
+        state = self.store.sync_state(domain, PROJECT, kind)
+
+        synced_at = datetime.datetime.utcnow()
+
+        if state and not self.config.refresh and state[0] <= start_date and state[1] >= end_date:
+
+            updated_after = datetime.datetime.strptime(state[2], '%Y%m%d%H%M%S') - SYNC_OVERLAP
+
+            self.log.info('Синхронизация {} проекта {}: изменения после {}'.format(kind, PROJECT, updated_after))
+
+            self.store.update(kind, domain, PROJECT, fetch(PROJECT, updated_after.strftime('%Y%m%d%H%M%S')))
+
+            start_date, end_date = state[0], state[1]
+
+        else:
+
+            self.log.info('Синхронизация {} проекта {}: полная загрузка за {} - {}'.format(kind, PROJECT, start_date, end_date))
+
+            self.store.replace(kind, domain, PROJECT, start_date, end_date, fetch(PROJECT))
+
+        self.store.set_sync_state(domain, PROJECT, kind, start_date, end_date, synced_at.strftime('%Y%m%d%H%M%S'))
+
+    # time entries and expenses for invoices, from API or (--incremental) from synced store
+
+    def project_time_entries(self, PROJECT):
+
+        if self.store is None:
+            return self.iter_time_entries(PROJECT)
+
+        self.sync_records(PROJECT, 'time_entries', self.iter_time_entries)
+
+        return self.store.records('time_entries', self.config.domain, PROJECT, self.start_date, self.end_date)
+
+    def project_expenses(self, PROJECT):
+
+        if self.store is None:
+            return self.iter_expenses(PROJECT)
+
+        self.sync_records(PROJECT, 'expenses', self.iter_expenses)
+
+        return self.store.records('expenses', self.config.domain, PROJECT, self.start_date, self.end_date)
+
+    # processing of project: fetched once for all periods of run (--periods), every period gets its own
+    # fixed expenses invoices, time entries invoices and pdfs.
+    # Doesn't touch reports, returns results of periods which are merged in projects order,
+    # so projects may be processed concurrently with the same report as in serial run
+
+    def process_project(self, PROJECT):
+
+        self.log.info('Проект {}'.format(PROJECT))
+
+        # project done in resumed run - its results are taken from journal
+
+        if PROJECT in self.resume.projects:
+            self.log.info('Проект {} уже обработан, результат из журнала'.format(PROJECT))
+
+            results = [PeriodResult.from_journal(result) for result in self.resume.projects[PROJECT]]
+
+            if self.config.check_lost and any(result.ledger is None for result in results):
+                self.log_error('Неоплаченные фиксированные расходы и time entries проекта {} неизвестны: прерванный запуск был без --check-lost'.format(PROJECT))
+
+            return results
+
+        records = self.fetch_project(PROJECT)
+
+        return self.project_done([self.process_period(records, period) for period in self.periods])
+
+    # fixed expenses invoices, time entries invoices and pdfs of project for one period
+
+    def process_period(self, records, period):
+
+        PROJECT = records.project
+
+        if len(self.periods) > 1:
+            self.log.info('Проект {}, период {}'.format(PROJECT, period_label(period)))
+
+        result = PeriodResult(PROJECT, period, Ledger(PROJECT) if self.config.check_lost else None)
+
+        ledger = result.ledger
+
+        self.log.info('Начинаем формировать счет для фиксированных затрат')
+
+        expenses = self.normalize_expenses(records, period, result)
+
+        if not self.invoice_expenses(records, period, self.aggregate_expenses(expenses), result):
+
+            # time entries of project without billing can't be invoiced, for --check-lost all of them are lost
+
+            if ledger:
+                for entrie in self.fetch_time_entries(records, period):
+                    ledger.expect('time_entries', entrie.id, entrie.person_id, entrie)
+
+            return result
+
+        result.billing = True
+
+        # get rates for people in all projects for report.txt needs
+
+        project_rates = result.rates = self.fetch_rates(records)
+
+        # get time entries
+
+        self.log.info('Получаем time entries')
+
+        # with one period entries go page by page through filtering, aggregation and per person grouping, pages aren't kept.
+        # Time entries are fetched while they are aggregated, so phase includes aggregation
+
+        with self.metrics.phase('fetch_time_entries'):
+            entries = self.normalize_time_entries(records, period, ledger)
+            aggregate = aggregate_time_entries(entries, project_rates, keep_entries=bool(self.config.pdfdir))
+
+        result.time_by_person = aggregate['time_by_person']
+        result.cost_cents_by_person = aggregate['cost_cents_by_person']
+
+        self.log.info('Начинаем формировать счета')
+
+        invoiced = self.invoice_time_entries(records, period, aggregate, result)
+
+        if self.config.pdfdir:
+            self.render_pdfs(records, period, aggregate, invoiced)
+
+        return result
+
+    # normalize stage
+
+    # not invoiced expenses of period with their persons (name of expense is full name of person),
+    # unidentified ones go to errors.txt for manager who will check them manually
+
+    def normalize_expenses(self, records, period, result):
+
+        PROJECT = records.project
+
+        ledger = result.ledger
+
+        expenses = []
+
+        invoiced_expense_ids = self.resume.invoiced_ids(PROJECT, 'fixed')  # already in invoices of resumed run
+
+        for expense in records.expenses_by_period[period]:
+
+            if expense['id'] in invoiced_expense_ids:
+                continue
+
+            # dates are YYYYMMDD, so they are compared as strings (API filters them too, this is a safety check)
+
+            if expense['invoice-id'] != '' or not period[0] <= expense['date'] <= period[1]:
+                continue
+
+            expense_name = expense['name']
+
+            user_id_for_fixed_expense = self.people.person_id(expense_name)
+
+            # several people with the same full name - expense belongs to the one who is in project
+
+            if user_id_for_fixed_expense is None and self.people.is_ambiguous(expense_name):
+
+                user_id_for_fixed_expense = self.people.person_id(expense_name, self.fetch_project_members(records))
+
+                if user_id_for_fixed_expense is None:
+                    if ledger:
+                        ledger.expect('expenses', expense['id'], None, expense)
+                    self.log_error('Несколько сотрудников с именем {} (id {}), не удалось определить сотрудника для фиксированного расхода. Проект {}. Параметры фиксированного расхода: дата создания {}, описание {}, создатель {}, сумма {}.'.format(expense_name, ', '.join(self.people.ids(expense_name)), PROJECT, expense['date'], expense['description'], expense['created-by-user-lastname'], expense['cost']))
+                    continue
+
+            if user_id_for_fixed_expense is None:
+
+                project_url = self.config.domain
+
+                if project_url[len(project_url)-1] != '/':
+
+                    project_url += '/'
+
+                project_url += '#/projects/'
+
+                project_url += PROJECT
+
+                self.log_error('Не удалось идентифицировать сотрудника при обработке фиксированных расходов. Проект {}. Параметры фиксированного расхода:  имя {}, дата создания {}, описание {}, создатель {}, сумма {}.'.format(project_url, expense['name'], expense['date'], expense['description'], expense['created-by-user-lastname'], expense['cost']))
+
+                if ledger:
+                    ledger.expect('expenses', expense['id'], None, expense)
+
+                continue
+
+            if ledger:
+                ledger.expect('expenses', expense['id'], user_id_for_fixed_expense, expense)
+
+            expenses.append(FixedExpense(expense['id'], user_id_for_fixed_expense, expense['cost']))
+
+            # summarazing expenses per user across all projects for report.txt (on merge)
+
+            result.expenses_cost.append((user_id_for_fixed_expense, expense['cost']))
+
+        return expenses
+
+    # billable time entries of period not yet invoiced (by API or in resumed run), each once
+
+    def normalize_time_entries(self, records, period, ledger=None):
+        return new_time_entries(self.fetch_time_entries(records, period), self.resume.invoiced_ids(records.project, 'time'), ledger)
+
+    # aggregate stage (time entries are aggregated by costs.aggregate_time_entries)
+
+    # fixed expenses per person: person id -> expenses, in order of first expense of person
+
+    def aggregate_expenses(self, expenses):
+        expenses_by_person = {}
+        for expense in expenses:
+            expenses_by_person.setdefault(expense.person_id, []).append(expense)
+        return expenses_by_person
+
+    # invoice stage
+
+    # invoices of fixed expenses of persons, created concurrently. Returns False if project has no billing
+    # (invoice can't be created)
+
+    def invoice_expenses(self, records, period, expenses_by_person, result):
+
+        PROJECT = records.project
+
+        ledger = result.ledger
+
+        fixed_invoices = []
+
+        for user_id, user_expenses in expenses_by_person.items():
+            fixed_invoices.append(InvoiceSpec(
+                self.invoice_number('Fix_' + self.people.names_by_id[user_id], period),
+                {"expenses": ','.join(expense.id for expense in user_expenses)},
+                {'project': PROJECT, 'period': period_label(period), 'kind': 'fixed', 'person': user_id,
+                 'items': [expense.id for expense in user_expenses], 'costs': [expense.cost for expense in user_expenses]}))
+
+        # invoices of resumed run which got line items before crash
+
+        for record in self.resume.attached_invoices(PROJECT, period_label(period), 'fixed'):
+            result.expenses_cost.extend((record['person'], cost) for cost in record['costs'])
+            result.invoices.append((record['number'], record['invoice'], None))
+
+        project_billing = True
+
+        with self.metrics.phase('create_invoices'):
+            fixed_results = self.create_invoices(PROJECT, fixed_invoices)
+
+        for invoice, (invoice_id, error, rejected) in zip(fixed_invoices, fixed_results):
+
+            invoice_name = invoice.number
+            user_id = invoice.journal['person']
+            user_expenses = invoice.journal['items']
+
+            if invoice_id is None and rejected:
+                # Some projects may haven't billing option (API rejects invoice), skip them
+                self.log_error('Ошибка ответа от API (create invoice for fixed expenses for user name {} in project {}: {})!'.format(invoice_name, PROJECT, error))
+                project_billing = False
+                continue
+
+            # other failures (connection, timeout, server error, wrong answer) - error of this person only
+
+            if invoice_id is None:
+                self.log_error('Ошибка ответа от API (create invoice for fixed expenses, project {}, user name {}, expenses {}: {})!'.format(PROJECT, invoice_name, ','.join(user_expenses), error))
+                result.invoices.append((invoice_name, None, error))
+                continue
+
+            if error:
+                self.log_error('Ошибка ответа от API (create lineitems for invoice fixed expenses, project {}, user name {}, invoice {}, expenses {}: {})!'.format(PROJECT, invoice_name, invoice_id, ','.join(user_expenses), error))
+                result.invoices.append((invoice_name, invoice_id, error))
+                continue
+
+            result.invoices.append((invoice_name, invoice_id, None))
+
+            if self.store:
+                self.store.mark_invoiced('expenses', self.config.domain, user_expenses, invoice_id)
+                self.store.add_invoice(self.config.domain, invoice_id, PROJECT, user_id, 'fixed', user_expenses, invoice_date())
+
+            if ledger:
+                ledger.invoice('expenses', user_expenses)
+
+        return project_billing
+
+    # invoices of time entries of persons, created concurrently, results are handled in persons order.
+    # Returns persons ('person id;;person name') whose invoices are created
+
+    def invoice_time_entries(self, records, period, aggregate, result):
+
+        PROJECT = records.project
+
+        ledger = result.ledger
+
+        items = aggregate['items']
+        totals_by_person = aggregate['totals_by_person']
+
+        # invoices of resumed run which got line items before crash
+
+        for record in self.resume.attached_invoices(PROJECT, period_label(period), 'time'):
+            result.time_by_person[record['person']] = result.time_by_person.get(record['person'], 0) + record['minutes']
+            result.cost_cents_by_person[record['person']] = result.cost_cents_by_person.get(record['person'], 0) + record['cost_cents']
+            result.invoices.append((record['number'], record['invoice'], None))
+
+        time_invoices = []
+
+        for person in items:
+            person_id, name = person.split(';;')
+            time_invoices.append(InvoiceSpec(
+                self.invoice_number(name, period),
+                {"timelogs": ','.join(items[person])},
+                {'project': PROJECT, 'period': period_label(period), 'kind': 'time', 'person': person_id, 'items': items[person],
+                 'minutes': totals_by_person[person][0], 'cost_cents': totals_by_person[person][1]}))
+
+        with self.metrics.phase('create_invoices'):
+            time_results = self.create_invoices(PROJECT, time_invoices)
+
+        invoiced = []
+
+        for person, invoice, (invoice_id, error, _) in zip(items, time_invoices, time_results):
+
+            number = invoice.number
+
+            if invoice_id is None:
+                self.log_error('Ошибка ответа от API (create invoice for time entries, project {}, person {}: {})!'.format(PROJECT, number, error))
+                result.invoices.append((number, None, error))
+                continue
+
+            if error:
+                self.log_error('Ошибка ответа от API (create lineitems for invoice time entries, project {}, invoice {}, timelogs {}: {})!'.format(PROJECT, invoice_id, ','.join(items[person]), error))
+                result.invoices.append((number, invoice_id, error))
+                continue
+
+            result.invoices.append((number, invoice_id, None))
+
+            if self.store:
+                self.store.mark_invoiced('time_entries', self.config.domain, items[person], invoice_id)
+                self.store.add_invoice(self.config.domain, invoice_id, PROJECT, person.split(';;')[0], 'time', items[person], invoice_date())
+
+            if ledger:
+                ledger.invoice('time_entries', items[person])
+
+            invoiced.append(person)
+
+        return invoiced
+
+    # number of invoice, with several periods in run it tells the period
+
+    def invoice_number(self, name, period):
+        if len(self.periods) == 1:
+            return name
+        return '{} {}'.format(name, period_label(period))
+
+    # invoices of persons of one project, created concurrently by invoice workers threads
+    # (POST and PUT of one person go one after another), results (invoice id, error, rejected) in order of invoices
+
+    def create_invoices(self, PROJECT, invoices):
+
+        def create(invoice):
+            return self.create_invoice(PROJECT, invoice)
+
+        if self.config.invoice_workers > 1 and len(invoices) > 1:
+            with ThreadPoolExecutor(max_workers=min(self.config.invoice_workers, len(invoices))) as executor:
+                return list(executor.map(self.metrics.bound(create), invoices))
+
+        return [create(invoice) for invoice in invoices]
+
+    # creates invoice for one person and attaches line items to it (POST, then PUT to created invoice),
+    # both steps go to journal. Returns (invoice id or None if invoice wasn't created, error text or None, rejected),
+    # rejected - API refused invoice with 4xx (project without billing), not a temporary failure
+
+    def create_invoice(self, PROJECT, invoice):
+
+        number = invoice.number
+        journal = invoice.journal
+
+        # invoice created before crash of resumed run gets only line items
+
+        invoice_id = self.resume.created.get(invoice_key(journal))
+
+        if invoice_id:
+            self.log.info('Счет {} проекта {} уже создан (invoice {}), добавляем позиции'.format(number, PROJECT, invoice_id))
+            return self.attach_lineitems(invoice_id, invoice, reconcile=True) + (False,)
+
+        data = {"invoice":
+                {"number": number,
+                 "currency-code": "USD",
+                 "display-date": invoice_date(),
+                 "fixed-cost": "",
+                 "description": "",
+                 "po-number": ""}
+                }
+
+        try:
+            response = self.client.post(
+                '/projects/' + PROJECT + '/invoices.json',
+                json=data)
+            created = response.json()
+        except requests.exceptions.HTTPError as e:
+            return None, 'create invoice: {}'.format(e), invoice_rejected(e.response)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            return None, 'create invoice: {}'.format(e), False
+
+        if created.get('STATUS') != 'OK':
+            return None, 'create invoice: STATUS {}'.format(created.get('STATUS')), False
+
+        self.journal.write('invoice_created', project=journal['project'], period=journal['period'], kind=journal['kind'],
+                           person=journal['person'], number=number, invoice=created['id'])
+
+        return self.attach_lineitems(created['id'], invoice) + (False,)
+
+    # attach line items to previously created invoice.
+    # PUT "add" isn't idempotent: after an error with unknown outcome (5xx, timeout, broken connection) line items
+    # may be already added, so before the next attempt invoice is asked which items it has and only missing ones
+    # are added. reconcile - ask before the first attempt too (invoice of resumed run, PUT could be done before crash)
+
+    def attach_lineitems(self, invoice_id, invoice, reconcile=False):
+
+        (kind, ids), = invoice.lineitems.items()
+        missing = ids.split(',')
+        attempt = 0
+
+        while True:
+            if reconcile:
+                try:
+                    attached = self.invoice_lineitems(invoice_id, kind)
+                except (requests.exceptions.RequestException, ValueError) as e:
+                    return invoice_id, 'check lineitems: {}'.format(e)
+
+                missing = [item for item in missing if item not in attached]
+                if not missing:
+                    break
+
+            data = {"lineitems":
+                    {"add": {kind: ','.join(missing)}}
+                    }
+
+            try:
+                response = self.client.put(
+                    '/invoices/' + invoice_id + '/lineitems.json',
+                    json=data)
+                response_json = response.json()
+            except requests.exceptions.HTTPError as e:
+                # 4xx - not added, nothing to reconcile
+                if e.response is None or e.response.status_code < 500 or attempt >= self.config.retries:
+                    return invoice_id, 'create lineitems: {}'.format(e)
+            except (requests.exceptions.RequestException, ValueError) as e:
+                if attempt >= self.config.retries:
+                    return invoice_id, 'create lineitems: {}'.format(e)
+            else:
+                if response_json.get('STATUS') != 'OK':
+                    return invoice_id, 'create lineitems: STATUS {}'.format(response_json.get('STATUS'))
+                break
+
+            self.log.info('Позиции счета {} (invoice {}) не подтверждены API, проверяем счет перед повтором'.format(invoice.number, invoice_id))
+            self.limiter.pause(self.client.backoff * (2 ** attempt))
+            reconcile = True
+            attempt += 1
+
+        self.journal.write('lineitems_attached', number=invoice.number, invoice=invoice_id, **invoice.journal)
+
+        return invoice_id, None
+
+    # ids of line items of kind (timelogs, expenses) which invoice already has
+
+    def invoice_lineitems(self, invoice_id, kind):
+        response = self.client.get('/invoices/' + invoice_id + '.json')
+        try:
+            return {str(item['id']) for item in response.json()['invoice'][kind]}
+        except (KeyError, TypeError) as e:
+            raise ValueError('no {} in invoice {}: {}'.format(kind, invoice_id, e))
+
+    # project result is journaled, so resumed run doesn't process project again
+    # (project with failed invoices is processed again to finish them)
+
+    def project_done(self, results):
+        if not any(error for result in results for _, _, error in result.invoices):
+            self.journal.write('project_done', project=results[0].project, results=[journaled_result(result) for result in results])
+        return results
+
+    # render stage
+
+    # pdfs of invoiced persons, rows and total of pdf are the same cents as in invoice summary and report.txt
+
+    def render_pdfs(self, records, period, aggregate, invoiced):
+
+        PROJECT = records.project
+
+        for person in invoiced:
+
+            name = person.split(';;')[1]
+
+            try:
+                invoices = list()
+                for tm, minutes, cost_cents in aggregate['persons'][person].rows():
+                    try:
+                        try:
+                            date = datetime.datetime.strptime(tm.date, r'%Y-%m-%dT%H:%M:%SZ')
+                        except Exception as e:
+                            date = None
+                            self.log_error('Ошибка извлечения даты из временной отметки (project {}, person {}): {}'.format(PROJECT, name, e))
+                            self.log_error('Ошибка извлечения даты из временной отметки, дата: {}'.format(tm.date))
+                            self.log_error('Ошибка извлечения даты из временной отметки, отметка: {}'.format(tm))
+
+                        invoices.append({
+                            'date': date,
+                            'name': name,
+                            'task': tm.todo_item_name,
+                            'comment': tm.description,
+                            'time': round(minutes / 60, 2),
+                            'cost': cents_to_money(cost_cents),
+                        })
+                    except Exception as e:
+                        self.log_error('Ошибка обработки временной отметки (project {}, person {}): {}'.format(PROJECT, name, e))
+                        self.log_error('Ошибка обработки временной отметки time entrie : {}'.format(tm))
+                summ = cents_to_money(aggregate['totals_by_person'][person][1])
+
+                # pdf is rendered by worker process of pdf queue, failures are logged after all projects,
+                # queued pdf goes to journal with its values, so resumed run can render it again
+
+                pdf_record = {
+                    'project': PROJECT,
+                    'person': name,
+                    'directory': self.config.pdfdir if len(self.periods) == 1 else os.path.join(self.config.pdfdir, period_label(period)),
+                    'filename': '({summ} usd) Invoice {project} {name}.pdf'.format(
+                        summ=str(summ).replace('.', ','),
+                        project=PROJECT,
+                        name=name,
+                        ),
+                    'values': {
+                        'name': name,
+                        'date': datetime.datetime.utcnow(),
+                        'invoices': invoices,
+                    },
+                }
+
+                self.journal.write('pdf_queued', **pdf_record)
+
+                self.submit_pdf(pdf_record)
+            except Exception as exp:
+                self.log_error('Ошибка сохранения PDF (project {}, person {}): {}'.format(PROJECT, name, exp))
+
+    # pdf of journaled 'pdf_queued' record to pdf queue, written pdf goes to journal
+
+    def submit_pdf(self, pdf_record):
+        self.pdf_queue.submit(
+            pdf_record['values'],
+            pdf_record['directory'],
+            pdf_record['filename'],
+            context=(pdf_record['project'], pdf_record['person']),
+            on_done=functools.partial(self.journal.write, 'pdf_written', project=pdf_record['project'],
+                                      person=pdf_record['person'], directory=pdf_record['directory'], filename=pdf_record['filename']))
+
+    # waits for pdfs rendering, returns failed ones
+
+    def wait_pdfs(self):
+
+        if not self.pdf_queue:
+            return []
+
+        self.log.info('Ожидаем завершения формирования PDF')
+
+        with self.metrics.phase('wait_pdfs'):
+            pdf_failed = self.pdf_queue.wait() if self.warm else self.pdf_queue.join()
+
+        # pdfs are rendered in worker processes, their timings come with results
+
+        for _, timing in self.pdf_queue.results:
+            self.metrics.observe_phase('render_html', timing['html_seconds'], timing['html_bytes'])
+            self.metrics.observe_phase('render_pdf', timing['pdf_seconds'], timing['pdf_bytes'])
+
+        for (project, name), exp in pdf_failed:
+            self.log_error('Ошибка сохранения PDF (project {}, person {}): {}'.format(project, name, exp))
+
+        self.log.info('PDF сформировано: {}, с ошибками: {}'.format(len(self.pdf_queue.jobs) - len(pdf_failed), len(pdf_failed)))
+
+        return pdf_failed
+
+    # report stage
+
+    # common info of report.txt and lost.txt
+
+    def report_header(self, project_ids):
+        now = datetime.datetime.now()
+        return [
+            "Created at {}".format('{:%Y-%m-%d %H:%M:%S}'.format(now)),
+            "Domain {}".format(self.config.domain),
+            "Dates from {} to {}".format(self.start_date, self.end_date),
+            "Projects {}".format(', '.join(project_ids)),
+        ]
+
+    # report.txt in current directory: table of people for every period (with several periods section starts with its dates)
+
+    def write_report(self, header, reports):
+
+        self.log.info('Начинаем формировать файл с общим отчётом')
+
+        report_started = ttime.perf_counter()
+
+        report_sections = [(report.period, report.rows(self.people.names_by_id)) for report in reports]
+
+        with open("report.txt", "w") as text_file:
+
+            for line in header:
+                print(line, file=text_file)
+
+            print("", file=text_file)
+
+            # info about people
+
+            table_headers = ['ID', 'NAME', 'HOURS', 'COST', 'EXPENSES', 'RATES']
+
+            row_format ="{:<15} {:<30} {:<15} {:<15} {:<15} {:<15}"
+
+            for section, (period, x) in enumerate(report_sections):
+
+                if len(self.periods) > 1:
+                    if section:
+                        print("", file=text_file)
+                    print("Period from {} to {}".format(*period), file=text_file)
+
+                print(row_format.format(*table_headers), file=text_file)
+
+                for row in x:
+                    print(row_format.format(*row), file=text_file)
+
+        self.metrics.observe_phase('report', ttime.perf_counter() - report_started)
+
+    # lost items: expenses and time entries which had to be invoiced but weren't, per person and per project,
+    # details go to errors.txt, summary to lost.txt in current directory
+
+    def write_lost(self, header, ledgers):
+
+        self.log.info('Проверяем неоплаченные фиксированные расходы и time entries')
+
+        check_lost_started = ttime.perf_counter()
+
+        people_names_by_id = self.people.names_by_id
+
+        lost = lost_by_person(ledgers)
+
+        # people in report order, then people who aren't in company directory and unidentified expenses (None)
+
+        lost_people = [person_id for person_id in people_names_by_id if person_id in lost]
+        lost_people += [person_id for person_id in lost if person_id not in people_names_by_id]
+
+        lost_rows = []
+
+        for person_id in lost_people:
+
+            for project, lost_items in lost[person_id].items():
+
+                if person_id is None:
+                    person_name = 'unknown'
+                elif person_id in people_names_by_id:
+                    person_name = people_names_by_id[person_id]
+                else:
+                    tm = lost_items['time_entries'][0]
+                    person_name = tm.name
+
+                lost_cost_cents = 0
+                lost_minutes = 0
+
+                for exp in lost_items['expenses']:
+                    lost_cost_cents += money_cents(exp['cost'])
+                    self.log_error("Не оплачено: person_id {} name {} project {} expense_id {} expense_name {} date {} cost {}".format(
+                        person_id, person_name, project, exp['id'], exp['name'], exp['date'], exp['cost']))
+
+                for tm in lost_items['time_entries']:
+                    lost_minutes += tm.total_minutes
+                    self.log_error("Не оплачено: time_entries {} name {} project {} time_entrie_id {} date {} time {}".format(
+                        person_id, person_name, project, tm.id, tm.date, tm.hours_decimal))
+
+                lost_rows.append([str(person_id or ''), person_name, project,
+                                  str(len(lost_items['expenses'])), str(cents_to_money(lost_cost_cents)),
+                                  str(len(lost_items['time_entries'])), str(round(lost_minutes / 60, 2))])
+
+        with open("lost.txt", "w") as text_file:
+
+            for line in header:
+                print(line, file=text_file)
+
+            print("", file=text_file)
+
+            table_headers = ['ID', 'NAME', 'PROJECT', 'EXPENSES', 'EXPENSES COST', 'TIME ENTRIES', 'HOURS']
+
+            row_format = "{:<15} {:<30} {:<15} {:<15} {:<15} {:<15} {:<15}"
+
+            print(row_format.format(*table_headers), file=text_file)
+
+            for row in lost_rows:
+                print(row_format.format(*row), file=text_file)
+
+        self.log.info('Не оплачено: {} сотрудников, {} фиксированных расходов, {} time entries'.format(
+            len(lost_people),
+            sum(len(project_items['expenses']) for projects in lost.values() for project_items in projects.values()),
+            sum(len(project_items['time_entries']) for projects in lost.values() for project_items in projects.values())))
+
+        self.metrics.observe_phase('check_lost', ttime.perf_counter() - check_lost_started)
+
+    # end of successful run: journal, stats of cache and limiter, metrics
+
+    def finish(self):
+
+        if self.cache:
+            self.log.info('Локальный кэш API: из кэша {hits}, подтверждено API {revalidated}, загружено {misses}'.format(**self.cache.stats))
+
+        self.journal.write('done')
+
+        self.log.info('Ожидание из-за ограничения частоты запросов API: {:.1f} с, запросов {}'.format(self.limiter.throttled - self.throttled_before[0], self.limiter.throttled_requests - self.throttled_before[1]))
+
+        # metrics of run (durations of phases are summed over projects, they overlap with workers)
+
+        for phase_name, phase_summary in self.metrics.summary()['phases'].items():
+            self.log.info('Этап {}: {} раз, {:.2f} с, запросов API {}, байт {}'.format(phase_name, phase_summary['count'], phase_summary['seconds'], phase_summary['requests'], phase_summary['bytes']))
+
+        self.metrics.write_json(self.logs.path / 'metrics.json')
+
+        if self.config.metrics_textfile:
+            self.metrics.write_prometheus(self.config.metrics_textfile)
+
+    # resources of run (those of warm state stay open)
+
+    def close(self):
+
+        if not self.warm:
+            if self.pdf_queue:
+                self.pdf_queue.join()
+            self.client.close()
+            self.renderer.stop()
+
+        if self.store:
+            self.store.close()
+
+        self.journal.close()
+
+        if self.own_logs:
+            self.logs.close()
@@ -0,0 +1,153 @@
+import email.utils
+import threading
+import time as ttime
+
+# share of X-RateLimit-Limit below which remaining requests are spread evenly until window reset
+
+LOW_REMAINING_SHARE = 0.1
+
+# limiters by domain, so all clients of one Teamwork instance share its limit
+# (and the server's rate limit headers seen by earlier runs of the service process)
+
+LIMITERS = {}
+LIMITERS_LOCK = threading.Lock()
+
+
+def limiter_for(domain, requests_per_minute=None):
+    domain = domain.rstrip('/')
+    with LIMITERS_LOCK:
+        if domain not in LIMITERS:
+            LIMITERS[domain] = RateLimiter(requests_per_minute)
+        else:
+            # every run sets its own --rate_limit, a run without one goes back to server driven rate
+            LIMITERS[domain].set_requests_per_minute(requests_per_minute)
+        return LIMITERS[domain]
+
+
+# parses --rate_limit value: "150" for --domain or "https://a.teamwork.com=150,https://b.teamwork.com=60"
+
+def parse_rate_limits(value, default_domain):
+    limits = {}
+    for part in value.split(','):
+        if '=' in part:
+            domain, rpm = part.rsplit('=', 1)
+        else:
+            domain, rpm = default_domain, part
+        limits[domain.rstrip('/')] = float(rpm)
+    return limits
+
+
+# token bucket limiter for Teamwork API requests
+# runs without delays while server allows it and slows down only on server request:
+# X-RateLimit-* headers (remaining requests in current window) and Retry-After header (429 responses)
+
+class RateLimiter:
+
+    def __init__(self, requests_per_minute=None):
+        self.lock = threading.Lock()
+        self.configured_rate = None
+        self.server_rate = None
+        self.tokens = 0.0
+        self.capacity = 1.0
+        self.updated = ttime.monotonic()
+        self.paused_until = 0.0
+        self.throttled = 0.0
+        self.throttled_requests = 0
+        self.set_requests_per_minute(requests_per_minute)
+
+    def set_requests_per_minute(self, requests_per_minute):
+        with self.lock:
+            self.configured_rate = requests_per_minute / 60 if requests_per_minute else None
+            self.capacity = max(1.0, self.configured_rate or 1.0)
+            self.tokens = self.capacity
+
+    # requests per second allowed now, None if unlimited
+
+    def rate(self):
+        rates = [r for r in (self.configured_rate, self.server_rate) if r]
+        return min(rates) if rates else None
+
+    # blocks until request may be sent (reserves token, so concurrent callers queue up fairly)
+
+    def acquire(self):
+        with self.lock:
+            now = ttime.monotonic()
+            wait = max(0.0, self.paused_until - now)
+            rate = self.rate()
+            if rate:
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * rate)
+                self.tokens -= 1
+                if self.tokens < 0:
+                    wait = max(wait, -self.tokens / rate)
+            self.updated = now
+            if wait > 0:
+                self.throttled += wait
+                self.throttled_requests += 1
+
+        if wait > 0:
+            ttime.sleep(wait)
+
+    # adapts rate to rate limit headers of response
+
+    def update(self, response):
+        headers = response.headers
+        now = ttime.monotonic()
+
+        retry_after = parse_retry_after(headers.get('Retry-After'))
+        limit = header_number(headers, 'X-RateLimit-Limit', 'X-Rate-Limit-Limit')
+        remaining = header_number(headers, 'X-RateLimit-Remaining', 'X-Rate-Limit-Remaining')
+        reset = parse_reset(header_number(headers, 'X-RateLimit-Reset', 'X-Rate-Limit-Reset'))
+
+        with self.lock:
+            if retry_after is not None:
+                self.paused_until = max(self.paused_until, now + retry_after)
+
+            if remaining is None or reset is None:
+                return
+
+            if remaining <= 0:
+                self.paused_until = max(self.paused_until, now + reset)
+                self.server_rate = None
+            elif limit and remaining > limit * LOW_REMAINING_SHARE:
+                self.server_rate = None
+            else:
+                self.server_rate = remaining / max(reset, 1.0)
+
+    def pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, ttime.monotonic() + seconds)
+
+
+def header_number(headers, *names):
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            try:
+                return float(value)
+            except ValueError:
+                return None
+    return None
+
+
+# X-RateLimit-Reset may be seconds till reset or unix timestamp of reset
+
+def parse_reset(value):
+    if value is None:
+        return None
+    if value > 1e9:
+        value -= ttime.time()
+    return max(value, 0.0)
+
+
+# Retry-After is seconds or http date
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(date.timestamp() - ttime.time(), 0.0)
@@ -0,0 +1,58 @@
+from entries import TimeEntry
+
+# --check-lost: ids of expenses and time entries which had to be invoiced (not invoiced, billable, in dates of run)
+# and ids which were really attached to invoices, recorded for every project during main pass,
+# so lost items are found without fetching projects again
+
+class Ledger:
+
+    def __init__(self, project):
+        self.project = project
+        self.expected = {'expenses': {}, 'time_entries': {}}  # id -> (person id or None, record)
+        self.invoiced = {'expenses': set(), 'time_entries': set()}
+
+    def expect(self, kind, record_id, person_id, record):
+        self.expected[kind][record_id] = (person_id, record)
+
+    def invoice(self, kind, ids):
+        self.invoiced[kind].update(ids)
+
+    # (kind, person id, record) of every expected but not invoiced item
+
+    def lost(self):
+        for kind, records in self.expected.items():
+            invoiced = self.invoiced[kind]
+            for record_id, (person_id, record) in records.items():
+                if record_id not in invoiced:
+                    yield kind, person_id, record
+
+    # lost items for journal of done project: [kind, person id, record], time entries as fields of API
+
+    def journaled_lost(self):
+        return [[kind, person_id, record.to_api() if kind == 'time_entries' else record] for kind, person_id, record in self.lost()]
+
+    # ledger of project done in resumed run, with its journaled lost items
+
+    @classmethod
+    def from_journal(cls, project, lost):
+        ledger = cls(project)
+        for kind, person_id, record in lost:
+            if kind == 'time_entries':
+                record = TimeEntry.from_api(record)
+                ledger.expect(kind, record.id, person_id, record)
+            else:
+                ledger.expect(kind, record['id'], person_id, record)
+        return ledger
+
+
+# lost items of all projects in one pass: person id -> project -> {'expenses': [...], 'time_entries': [...]}
+# (person id None - expenses whose person wasn't identified)
+
+def lost_by_person(ledgers):
+    lost = {}
+    for ledger in ledgers:
+        for kind, person_id, record in ledger.lost():
+            projects = lost.setdefault(person_id, {})
+            items = projects.setdefault(ledger.project, {'expenses': [], 'time_entries': []})
+            items[kind].append(record)
+    return lost
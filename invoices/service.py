@@ -0,0 +1,524 @@
+#!/usr/bin/env python3.8
+
+import datetime
+import functools
+import getopt
+import json
+import multiprocessing
+import multiprocessing.util
+import os
+import queue
+import re
+import signal
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import main
+from api import TeamworkClient
+from cache import ResponseCache
+from pdf import PdfRenderer, RenderQueue
+
+# service mode: long-running process which runs invoice and report jobs (runs of main.py with the same
+# parameters) submitted by local HTTP API. Jobs are queued and run by --jobs worker processes, every worker
+# runs one job at a time and keeps warm state between its jobs: imported modules, keep-alive connection pools
+# of domains, rate limiters, open cache of API responses (people, rates, projects), pdf worker processes with
+# compiled template. Xvfb display for pdfs is started once by service and shared by all workers
+
+# files of job which are served by GET /jobs/<id>/<file>
+
+JOB_FILES = ('report.txt', 'lost.txt', 'log.txt', 'errors.txt', 'metrics.json')
+
+# parameters of job which are set by service
+
+SERVICE_PARAMS = ('help', 'logdir')
+
+# parameters which jobs can't have: every job has its own new logdir, so there is no journal to --resume
+# (interrupted job is resumed by main.py --resume with directory of job as --logdir)
+
+UNSUPPORTED_PARAMS = ('resume',)
+
+# prints error and usage instructions in situations when wrong arguments passed in console
+
+def print_usage():
+    script_name = os.path.basename(__file__)
+    print('Error: wrong startup arguments')
+    print('Usage:', script_name, ' --port <port> --jobs <jobs> --max_queue <jobs> --workdir <directory_for_jobs> --cachedir <directory_for_cache> --domain <domain> --apikey <apikey>')
+    print('Help:', script_name, ' --help')
+
+# prints help for running with --help flag
+
+def print_help():
+    script_name = os.path.basename(__file__)
+
+    help = f'''
+        {script_name} --port <port> --jobs <jobs> --max_queue <jobs> --workdir <directory_for_jobs> --cachedir <directory_for_cache> --domain <domain> --apikey <apikey>
+
+        Service mode of main.py: runs invoice and report jobs submitted by local HTTP API (127.0.0.1) without starting new python process for every run. Between jobs connection pools to Teamwork, local cache of API responses (people, rates, projects), Xvfb display and pdf worker processes with compiled template stay warm.
+
+        All arguments are optional.
+
+        Examples:
+
+            {script_name} --port 8910 --jobs 2 --domain https://netping.teamwork.com --apikey twp_******************
+            curl -d '{{"project_ids": "all_projects", "start_date": "last_month", "end_date": "last_month", "pdfdir": "/srv/pdf", "check-lost": true}}' http://127.0.0.1:8910/jobs
+            curl http://127.0.0.1:8910/jobs/<id>
+            curl http://127.0.0.1:8910/jobs/<id>/report.txt
+
+        API:
+
+            POST /jobs
+                New job, body is json object of arguments of main.py without leading --: {{"project_ids": "1,2", "periods": "202005", "check-lost": true}}, flags are true. --domain and --apikey of service are used if job has none, --cachedir of service - if job has neither "cachedir" nor "no-cache". "logdir" is set by service: directory of job in --workdir, report.txt and lost.txt are written there too. "resume" is not accepted (new job has no journal), interrupted job is continued by main.py --resume --logdir <directory of job>. Answers 202 with status of job, 400 on wrong arguments, 503 if queue is full.
+
+            GET /jobs
+                Statuses of all jobs of service, numbers of queued and running jobs.
+
+            GET /jobs/<id>
+                Status of job: queued, running, done (with summary - projects, invoices created and failed, pdfs failed, seconds), failed (with error) or cancelled.
+
+            GET /jobs/<id>/<file>
+                File of job: report.txt, lost.txt, log.txt, errors.txt, metrics.json.
+
+            DELETE /jobs/<id>
+                Cancels job which is still queued.
+
+        Arguments:
+
+            --port port
+                Port to listen on 127.0.0.1, default 8910.
+
+            --jobs jobs
+                Jobs run at the same time, default 1. Every job is run by its own worker process (with its own warm state), so jobs with --workers N make N * jobs concurrent projects. Rate limiters are per worker process too.
+
+            --max_queue jobs
+                Jobs waiting in queue, default 100. More jobs are rejected (503).
+
+            --workdir directory_for_jobs
+                Directory for directories of jobs (logs, journal, report.txt, lost.txt), default ./service_jobs.
+
+            --cachedir directory_for_cache
+                Local cache of API responses (and store of --incremental) shared by jobs, default cache in --workdir.
+
+            --domain domain
+                Domain of jobs without "domain".
+
+            --apikey apikey
+                API key of jobs without "apikey", it isn't shown in statuses of jobs.
+        '''
+
+    print(help)
+
+
+# warm state of worker process (main.run uses it instead of creating and closing its own)
+
+class WarmState:
+
+    def __init__(self, display):
+        self.renderer = PdfRenderer(display)
+        self.clients = {}  # (domain, apikey) -> TeamworkClient
+        self.caches = {}  # path -> ResponseCache
+        self.render_queues = {}  # (pdf workers, template cache) -> RenderQueue
+
+    # client with open connection pool of domain, settings of run are applied to it
+    # (pool size is the one of first run)
+
+    def client(self, domain, apikey, timeout, retries, limiter, pool_size, cache, metrics):
+        key = (domain.rstrip('/'), apikey)
+        if key not in self.clients:
+            self.clients[key] = TeamworkClient(domain, apikey, pool_size=pool_size)
+        client = self.clients[key]
+        client.timeout = timeout
+        client.retries = retries
+        client.limiter = limiter
+        client.cache = cache
+        client.metrics = metrics
+        return client
+
+    def cache(self, path, refresh=False):
+        path = str(Path(path).resolve())
+        if path not in self.caches:
+            self.caches[path] = ResponseCache(path)
+        cache = self.caches[path]
+        cache.refresh = refresh
+        cache.stats = dict.fromkeys(cache.stats, 0)
+        return cache
+
+    def render_queue(self, workers, bytecode_cache_dir=None):
+        key = (workers, bytecode_cache_dir)
+        if key not in self.render_queues:
+            self.render_queues[key] = RenderQueue(self.renderer, workers, bytecode_cache_dir=bytecode_cache_dir)
+        render_queue = self.render_queues[key]
+        render_queue.reset()
+        return render_queue
+
+    def close(self):
+        for client in self.clients.values():
+            client.session.close()
+        for cache in self.caches.values():
+            cache.close()
+        for render_queue in self.render_queues.values():
+            render_queue.join()
+
+
+WARM = None  # WarmState of worker process
+
+
+# initializer of worker process
+
+def start_worker(display):
+    global WARM
+    # Ctrl+C stops service, which lets running jobs finish
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    WARM = WarmState(display)
+    # workers of ProcessPoolExecutor don't run atexit, finalizers are run. Pdf workers are stopped
+    # before finalizers of multiprocessing queues (priority 10) stop their feeder threads
+    multiprocessing.util.Finalize(WARM, WARM.close, exitpriority=100)
+
+
+# runs job in worker process, report.txt and lost.txt go to directory of job
+
+def run_job(argv, directory, logdir):
+    os.chdir(directory)
+
+    try:
+        summary = main.run(argv, warm=WARM)
+        exit_code = None
+    except SystemExit as e:
+        summary = None
+        exit_code = e.code
+
+    if summary is None:
+        raise RuntimeError('run failed{}: {}'.format(
+            ' (exit code {})'.format(exit_code) if exit_code is not None else '', last_error(logdir)))
+
+    return summary
+
+
+# last line of errors.txt of run (without logger prefix)
+
+def last_error(logdir):
+    path = Path(logdir) / 'errors.txt'
+    if not path.exists():
+        return 'no errors.txt, missing arguments (usage is printed to output of service)'
+    with open(path, encoding='utf8') as errors_file:
+        lines = [line.rstrip('\n') for line in errors_file if line.strip()]
+    return lines[-1].split(' - ', 1)[-1] if lines else 'no errors in errors.txt'
+
+
+class Job:
+
+    def __init__(self, job_id, params, argv, directory, logdir):
+        self.id = job_id
+        self.params = params  # arguments of job without apikey (for status)
+        self.argv = argv
+        self.directory = directory
+        self.logdir = logdir
+        self.status = 'queued'
+        self.submitted_at = datetime.datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self.summary = None
+        self.error = None
+
+    def state(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'params': self.params,
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'summary': self.summary,
+            'error': self.error,
+        }
+
+
+class QueueFull(Exception):
+    pass
+
+
+# jobs of service: queue, dispatcher thread which starts queued jobs when one of --jobs slots is free,
+# pool of worker processes (spawned, as pdf workers, because service has running threads)
+
+class JobQueue:
+
+    def __init__(self, workdir, cachedir, jobs=1, max_queue=100, defaults=None, renderer=None):
+        self.workdir = Path(workdir)
+        self.cachedir = cachedir
+        self.max_queue = max_queue
+        self.defaults = defaults or {}  # domain and apikey of service
+        self.jobs = {}  # id -> Job, in order of submission
+        self.lock = threading.Lock()
+        self.counter = 0
+        self.slots = threading.Semaphore(jobs)
+        self.queue = queue.Queue()
+        renderer = renderer or PdfRenderer()
+        self.executor = ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=start_worker, initargs=(renderer.display,))
+        self.dispatcher = threading.Thread(target=self.dispatch, daemon=True)
+        self.dispatcher.start()
+
+    # arguments of main.py for job parameters (json object), raises ValueError if they are wrong
+
+    def arguments(self, params, logdir):
+        if not isinstance(params, dict):
+            raise ValueError('job must be json object of arguments')
+
+        params = dict(self.defaults, **params)
+
+        if self.cachedir and 'cachedir' not in params and not params.get('no-cache'):
+            params['cachedir'] = self.cachedir
+
+        argv = []
+
+        for name, value in params.items():
+            if name in SERVICE_PARAMS:
+                raise ValueError('argument {} is set by service'.format(name))
+            if name in UNSUPPORTED_PARAMS:
+                raise ValueError('argument {} is not supported by jobs (job has its own new logdir without journal), run main.py --{} --logdir <directory of job>'.format(name, name))
+            if name not in main.LONG_OPTIONS and name + '=' not in main.LONG_OPTIONS:
+                raise ValueError('unknown argument {}'.format(name))
+            if name in main.LONG_OPTIONS:
+                if value is True:
+                    argv.append('--' + name)
+                elif value not in (False, None):
+                    raise ValueError('argument {} is flag (true or false)'.format(name))
+            elif value is not None:
+                argv += ['--' + name, str(value)]
+
+        argv += ['--logdir', str(logdir)]
+
+        getopt.getopt(argv, "", main.LONG_OPTIONS)
+
+        return argv, {name: value for name, value in params.items() if name != 'apikey'}
+
+    def submit(self, params):
+        with self.lock:
+            if sum(job.status == 'queued' for job in self.jobs.values()) >= self.max_queue:
+                raise QueueFull('queue is full ({} jobs)'.format(self.max_queue))
+
+            job_id = '{:%Y%m%d-%H%M%S}-{}'.format(datetime.datetime.now(), self.counter + 1)
+            directory = self.workdir / job_id
+
+            try:
+                argv, shown_params = self.arguments(params, directory)
+            except getopt.GetoptError as e:
+                raise ValueError(str(e))
+
+            self.counter += 1
+            directory.mkdir(parents=True)
+            job = self.jobs[job_id] = Job(job_id, shown_params, argv, directory, directory)
+
+        self.queue.put(job)
+        return job
+
+    def cancel(self, job):
+        with self.lock:
+            if job.status != 'queued':
+                return False
+            job.status = 'cancelled'
+            job.finished_at = datetime.datetime.now()
+            return True
+
+    def dispatch(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+
+            self.slots.acquire()
+
+            with self.lock:
+                if job.status != 'queued':
+                    self.slots.release()
+                    continue
+                job.status = 'running'
+                job.started_at = datetime.datetime.now()
+
+            future = self.executor.submit(run_job, job.argv, str(job.directory), str(job.logdir))
+            future.add_done_callback(functools.partial(self.finish, job))
+
+    def finish(self, job, future):
+        exception = future.exception()
+        with self.lock:
+            job.finished_at = datetime.datetime.now()
+            if exception is not None:
+                job.status = 'failed'
+                job.error = str(exception)
+            else:
+                job.status = 'done'
+                job.summary = future.result()
+        self.slots.release()
+
+    def states(self):
+        with self.lock:
+            return {
+                'queued': sum(job.status == 'queued' for job in self.jobs.values()),
+                'running': sum(job.status == 'running' for job in self.jobs.values()),
+                'jobs': [job.state() for job in self.jobs.values()],
+            }
+
+    # running jobs are finished, queued ones are cancelled
+
+    def close(self):
+        with self.lock:
+            for job in self.jobs.values():
+                if job.status == 'queued':
+                    job.status = 'cancelled'
+        self.queue.put(None)
+        self.dispatcher.join()
+        self.executor.shutdown(wait=True)
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+
+    jobs = None  # JobQueue, set by serve()
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body):
+        content = json.dumps(body, ensure_ascii=False, default=str).encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def send_error_json(self, status, message):
+        self.send_json(status, {'error': message})
+
+    def job(self, job_id):
+        with self.jobs.lock:
+            return self.jobs.jobs.get(job_id)
+
+    def do_GET(self):
+        if self.path == '/jobs':
+            return self.send_json(200, self.jobs.states())
+
+        match = re.fullmatch(r'/jobs/([\w-]+)(?:/([\w.]+))?', self.path)
+        job = self.job(match.group(1)) if match else None
+
+        if job is None:
+            return self.send_error_json(404, 'not found')
+
+        if not match.group(2):
+            with self.jobs.lock:
+                return self.send_json(200, job.state())
+
+        name = match.group(2)
+        path = (job.directory if name in ('report.txt', 'lost.txt') else job.logdir) / name
+
+        if name not in JOB_FILES or not path.exists():
+            return self.send_error_json(404, 'not found')
+
+        content = path.read_bytes()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8' if name.endswith('.json') else 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_POST(self):
+        if self.path != '/jobs':
+            return self.send_error_json(404, 'not found')
+
+        length = int(self.headers.get('Content-Length') or 0)
+
+        try:
+            job = self.jobs.submit(json.loads(self.rfile.read(length) or b'{}'))
+        except ValueError as e:
+            return self.send_error_json(400, str(e))
+        except QueueFull as e:
+            return self.send_error_json(503, str(e))
+
+        with self.jobs.lock:
+            self.send_json(202, job.state())
+
+    def do_DELETE(self):
+        match = re.fullmatch(r'/jobs/([\w-]+)', self.path)
+        job = self.job(match.group(1)) if match else None
+
+        if job is None:
+            return self.send_error_json(404, 'not found')
+
+        if not self.jobs.cancel(job):
+            return self.send_error_json(409, 'job is {}'.format(job.status))
+
+        with self.jobs.lock:
+            self.send_json(200, job.state())
+
+
+def serve(jobs, port=8910):
+    handler = type('Handler', (ServiceHandler,), {'jobs': jobs})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == '__main__':
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "", ["help", "port=", "jobs=", "max_queue=", "workdir=", "cachedir=", "domain=", "apikey="])
+    except getopt.GetoptError:
+        print_usage()
+        sys.exit(2)
+
+    PORT = 8910
+    JOBS = 1
+    MAX_QUEUE = 100
+    WORKDIR = 'service_jobs'
+    CACHE_DIR = ''
+    DEFAULTS = {}
+
+    for opt, arg in opts:
+        if opt == '--help':
+            print_help()
+            sys.exit(2)
+        elif opt == '--port':
+            PORT = int(arg)
+        elif opt == '--jobs':
+            JOBS = max(1, int(arg))
+        elif opt == '--max_queue':
+            MAX_QUEUE = max(1, int(arg))
+        elif opt == '--workdir':
+            WORKDIR = arg
+        elif opt == '--cachedir':
+            CACHE_DIR = arg
+        elif opt == '--domain':
+            DEFAULTS['domain'] = arg
+        elif opt == '--apikey':
+            DEFAULTS['apikey'] = arg
+        else:
+            print_usage()
+            sys.exit(2)
+
+    WORKDIR = Path(WORKDIR).resolve()
+    WORKDIR.mkdir(parents=True, exist_ok=True)
+
+    CACHE_DIR = str(Path(CACHE_DIR).resolve()) if CACHE_DIR else str(WORKDIR)
+
+    # one X server display for pdfs of all jobs (Linux)
+
+    RENDERER = PdfRenderer().start()
+
+    JOB_QUEUE = JobQueue(WORKDIR, CACHE_DIR, JOBS, MAX_QUEUE, DEFAULTS, RENDERER)
+
+    SERVER = serve(JOB_QUEUE, PORT)
+
+    # stop on SIGTERM (systemd, docker) as on Ctrl+C
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    print('Invoices service on http://127.0.0.1:{} ({} jobs at a time, jobs in {})'.format(PORT, JOBS, WORKDIR))
+
+    try:
+        SERVER.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        SERVER.server_close()
+        JOB_QUEUE.close()
+        RENDERER.stop()
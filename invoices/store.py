@@ -0,0 +1,135 @@
+import json
+import sqlite3
+import threading
+
+from entries import TimeEntry
+
+
+# local store of time entries, expenses and created invoices for incremental runs (--incremental)
+# sync state keeps for every project and kind of records the dates window which is in store
+# and time of last sync, so next run asks API only for records updated after it
+
+class SyncStore:
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(path), check_same_thread=False)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS time_entries (
+                domain TEXT NOT NULL,
+                project TEXT NOT NULL,
+                id TEXT NOT NULL,
+                date TEXT NOT NULL,
+                invoice_id TEXT NOT NULL DEFAULT '',
+                data TEXT NOT NULL,
+                PRIMARY KEY (domain, id)
+            );
+            CREATE INDEX IF NOT EXISTS time_entries_project ON time_entries (domain, project, date);
+            CREATE TABLE IF NOT EXISTS expenses (
+                domain TEXT NOT NULL,
+                project TEXT NOT NULL,
+                id TEXT NOT NULL,
+                date TEXT NOT NULL,
+                invoice_id TEXT NOT NULL DEFAULT '',
+                data TEXT NOT NULL,
+                PRIMARY KEY (domain, id)
+            );
+            CREATE INDEX IF NOT EXISTS expenses_project ON expenses (domain, project, date);
+            CREATE TABLE IF NOT EXISTS invoices (
+                domain TEXT NOT NULL,
+                id TEXT NOT NULL,
+                project TEXT NOT NULL,
+                person_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                items TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                PRIMARY KEY (domain, id)
+            );
+            CREATE TABLE IF NOT EXISTS sync_state (
+                domain TEXT NOT NULL,
+                project TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                start_date TEXT NOT NULL,
+                end_date TEXT NOT NULL,
+                synced_at TEXT NOT NULL,
+                PRIMARY KEY (domain, project, kind)
+            );''')
+        self.db.commit()
+
+    # (start_date, end_date, synced_at) of last sync of project records or None
+
+    def sync_state(self, domain, project, kind):
+        with self.lock:
+            return self.db.execute(
+                'SELECT start_date, end_date, synced_at FROM sync_state WHERE domain = ? AND project = ? AND kind = ?',
+                (domain, project, kind)).fetchone()
+
+    def set_sync_state(self, domain, project, kind, start_date, end_date, synced_at):
+        with self.lock:
+            self.db.execute(
+                'INSERT OR REPLACE INTO sync_state (domain, project, kind, start_date, end_date, synced_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (domain, project, kind, start_date, end_date, synced_at))
+            self.db.commit()
+
+    # full sync of dates window: records of window are replaced by fetched ones
+    # (records which were deleted or invoiced on server since last sync are dropped)
+
+    def replace(self, table, domain, project, start_date, end_date, records):
+        rows = [self.row(table, domain, project, record) for record in records]
+        with self.lock:
+            self.db.execute(
+                'DELETE FROM {} WHERE domain = ? AND project = ? AND date >= ? AND date <= ?'.format(table),
+                (domain, project, start_date, end_date))
+            self.db.executemany(self.upsert_sql(table), rows)
+            self.db.commit()
+
+    # incremental sync: changed records overwrite stored ones
+
+    def update(self, table, domain, project, records):
+        rows = [self.row(table, domain, project, record) for record in records]
+        with self.lock:
+            self.db.executemany(self.upsert_sql(table), rows)
+            self.db.commit()
+
+    # stored records of project with dates in window (YYYYMMDD), in order of ids as API returns them
+    # (time entries as TimeEntry records, expenses as dicts)
+
+    def records(self, table, domain, project, start_date, end_date):
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT data FROM {} WHERE domain = ? AND project = ? AND date >= ? AND date <= ? AND invoice_id = \'\' '
+                'ORDER BY CAST(id AS INTEGER)'.format(table),
+                (domain, project, start_date, end_date)).fetchall()
+        if table == 'time_entries':
+            return [TimeEntry.from_api(json.loads(data)) for data, in rows]
+        return [json.loads(data) for data, in rows]
+
+    # records attached to invoice by this script aren't returned again even before next sync confirms it
+
+    def mark_invoiced(self, table, domain, ids, invoice_id):
+        with self.lock:
+            self.db.executemany(
+                'UPDATE {} SET invoice_id = ? WHERE domain = ? AND id = ?'.format(table),
+                [(invoice_id, domain, record_id) for record_id in ids])
+            self.db.commit()
+
+    def add_invoice(self, domain, invoice_id, project, person_id, kind, items, created_at):
+        with self.lock:
+            self.db.execute(
+                'INSERT OR REPLACE INTO invoices (domain, id, project, person_id, kind, items, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (domain, invoice_id, project, person_id, kind, ','.join(items), created_at))
+            self.db.commit()
+
+    @staticmethod
+    def upsert_sql(table):
+        return 'INSERT OR REPLACE INTO {} (domain, project, id, date, invoice_id, data) VALUES (?, ?, ?, ?, ?, ?)'.format(table)
+
+    @staticmethod
+    def row(table, domain, project, record):
+        if table == 'time_entries':
+            return domain, project, record.id, record.day, record.invoice_no, json.dumps(record.to_api())
+        return domain, project, str(record['id']), record['date'], record['invoice-id'], json.dumps(record)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -1,3 +1,8 @@
 #!/bin/bash
 # Необходим для запуска wkhtmltopdf в остсуствии запузенного графического сервера
-/usr/bin/xvfb-run -a --server-args="-screen 0, 1024x768x24" /usr/bin/wkhtmltopdf $*
\ No newline at end of file
+WKHTMLTOPDF=/usr/bin/wkhtmltopdf
+# WKHTMLTOPDF_DISPLAY - дисплей Xvfb, уже запущенного скриптом (PdfRenderer в pdf.py), тогда xvfb-run не нужен
+if [ -n "$WKHTMLTOPDF_DISPLAY" ]; then
+    DISPLAY="$WKHTMLTOPDF_DISPLAY" exec "$WKHTMLTOPDF" "$@"
+fi
+/usr/bin/xvfb-run -a --server-args="-screen 0, 1024x768x24" $WKHTMLTOPDF $*
\ No newline at end of file